@@ -0,0 +1,215 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from devices import describe_device, get_device
+from pipeline import MOVE_COPY_GAMES, StagePipeline
+from progress import get_progress
+from trash import get_trash
+from utils import get_free_space, get_volume
+
+load_dotenv()
+
+MOVE_GAMES = int(os.getenv('MOVE_GAMES', '4'))
+MOVE_GAMES_PER_SOURCE = int(os.getenv('MOVE_GAMES_PER_SOURCE', '1'))
+MOVE_GAMES_PER_TARGET = int(os.getenv('MOVE_GAMES_PER_TARGET', '2'))
+
+MoveJob = namedtuple('MoveJob', ['game', 'target_base_dir', 'source_device', 'target_device', 'target_volume', 'size'])
+MoveResult = namedtuple('MoveResult', ['game', 'ok', 'seconds', 'size'])
+
+logger = logging.getLogger(__name__)
+
+
+class MoveBatch:
+    """
+    Move several games at once, limiting how many read from each source disk and write to each target disk.
+
+    Spinning disks take one game at a time whatever the limits. The disk limits apply to the copy stage, so the next
+    game on a disk starts copying while the previous one is verified and committed. Each game is moved by the
+    launcher's process_game, so it keeps its own rollback.
+
+    Moves may carry the number of bytes they copy, as a third item. Such a move only starts once its target volume
+    has room for it next to the copies already running there.
+    """
+
+    def __init__(self, process_game, games=None, games_per_source=None, games_per_target=None):
+        self.process_game = process_game
+        self.games = max(1, games or MOVE_GAMES)
+        self.games_per_source = max(1, games_per_source or MOVE_GAMES_PER_SOURCE)
+        self.games_per_target = max(1, games_per_target or MOVE_GAMES_PER_TARGET)
+        self.results = []
+        self.pipeline = None
+        self._sizes = Counter()
+        self._copies = {}
+        self._local = threading.local()
+        self._released = set()
+        self._reading = Counter()
+        self._writing = Counter()
+        self._reserved = Counter()
+        self._changed = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, moves, **kwargs):
+        """
+        Move each (game, target_base_dir[, size]) move, passing kwargs on to process_game, and return the results.
+        """
+        jobs = [
+            MoveJob(game, target, get_device(game.install_dir), get_device(target), get_volume(target), *(size or [0]))
+            for game, target, *size in moves
+        ]
+        logger.info(
+            f"Moving {len(jobs)} games, {self.games} at once, at most {self.games_per_source} per source disk "
+            f"and {self.games_per_target} per target disk"
+        )
+
+        pending = list(jobs)
+        running = {}
+        started = 0
+        waited_for_trash = False
+        self.pipeline = StagePipeline(copy_games=MOVE_COPY_GAMES or self.games)
+        start_time = time.monotonic()
+
+        progress = get_progress()
+        progress.subscribe(self._record_size)
+        try:
+            with progress.batch("Games", len(jobs)) as batch_progress, ThreadPoolExecutor(self.games) as executor:
+                while pending or running:
+                    for job in list(pending):
+                        if len(running) >= self.games:
+                            break
+                        if not self._reserve(job):
+                            continue
+
+                        pending.remove(job)
+                        started += 1
+                        waited_for_trash = False
+                        logger.info(
+                            f"Moving game {started}/{len(jobs)}: {job.game.name} "
+                            f"({describe_device(job.source_device)} -> {describe_device(job.target_device)})"
+                        )
+                        future = executor.submit(self._move, job, kwargs)
+                        future.add_done_callback(lambda _: self._changed.set())
+                        running[future] = job
+
+                    if pending and not running:
+                        if not waited_for_trash:
+                            logger.info("Waiting for background deletions to free space for the next games...")
+                            get_trash().wait()
+                            waited_for_trash = True
+                            continue
+
+                        for job in pending:
+                            logger.error(f"Not enough free space in '{job.target_base_dir}' to move '{job.game.name}'")
+                            self.results.append(MoveResult(job.game, False, 0.0, 0))
+                            batch_progress.advance(items=1)
+                        pending = []
+                        continue
+
+                    self._changed.wait()
+                    self._changed.clear()
+                    for future in [future for future in running if future.done()]:
+                        running.pop(future)
+                        self.results.append(future.result())
+                        batch_progress.advance(items=1)
+        finally:
+            progress.unsubscribe(self._record_size)
+
+        self.log_summary(time.monotonic() - start_time)
+        return self.results
+
+    def log_summary(self, seconds):
+        """
+        Log each game's outcome, size and throughput, the use of each stage, then the totals of the batch.
+        """
+        logger.info("Move summary:")
+        for result in sorted(self.results, key=lambda result: (result.ok, result.game.name)):
+            throughput = result.size / result.seconds if result.seconds else 0.0
+            logger.info(
+                f"  {'OK' if result.ok else 'FAILED':<6} {result.game.name}: {result.size / (1024 ** 3):.2f} GB "
+                f"in {result.seconds:.1f}s ({throughput / (1024 ** 2):.1f} MB/s)"
+            )
+
+        if self.pipeline:
+            self.pipeline.log_summary()
+
+        moved = [result for result in self.results if result.ok]
+        size = sum(result.size for result in self.results)
+        throughput = size / seconds if seconds else 0.0
+        logger.info(
+            f"Moved {len(moved)}/{len(self.results)} games, {len(self.results) - len(moved)} failed, "
+            f"{size / (1024 ** 3):.2f} GB copied in {seconds:.1f}s ({throughput / (1024 ** 2):.1f} MB/s)"
+        )
+
+    def _move(self, job, kwargs):
+        def on_release(stage_name):
+            if stage_name == 'copy':
+                self._release(job)
+
+        start_time = time.monotonic()
+        self._local.job = job
+        self.pipeline.bind(on_release)
+        try:
+            ok = bool(self.process_game(job.game, job.target_base_dir, **kwargs))
+        except Exception as e:
+            logger.error(f"Unexpected error moving game '{job.game.name}': {e}", exc_info=True)
+            ok = False
+        finally:
+            self.pipeline.unbind()
+            self._local.job = None
+            self._release(job)
+
+        with self._lock:
+            size = self._sizes.pop(job, 0)
+        return MoveResult(job.game, ok, time.monotonic() - start_time, size)
+
+    def _record_size(self, event):
+        # A game's copy starts in the thread moving it, which ties its tracker to the job. The bytes already done
+        # when it starts were skipped on resume or adoption and are left out of the throughput.
+        if event.kind != 'game':
+            return
+
+        if event.state == 'start':
+            job = getattr(self._local, 'job', None)
+            if job is not None:
+                with self._lock:
+                    self._copies[event.id] = (job, event.bytes_done)
+        elif event.state in ('finish', 'fail'):
+            with self._lock:
+                job, skipped = self._copies.pop(event.id, (None, 0))
+                if job is not None:
+                    self._sizes[job] += event.bytes_done - skipped
+
+    def _reserve(self, job):
+        with self._lock:
+            if self._reading[job.source_device.name] >= self._limit(job.source_device, self.games_per_source):
+                return False
+            if self._writing[job.target_device.name] >= self._limit(job.target_device, self.games_per_target):
+                return False
+            if job.size:
+                free_space = get_free_space(job.target_base_dir)
+                if free_space is not None and free_space - self._reserved[job.target_volume] < job.size:
+                    return False
+
+            self._reserved[job.target_volume] += job.size
+            self._reading[job.source_device.name] += 1
+            self._writing[job.target_device.name] += 1
+            return True
+
+    def _release(self, job):
+        with self._lock:
+            if job in self._released:
+                return
+            self._released.add(job)
+            self._reading[job.source_device.name] -= 1
+            self._writing[job.target_device.name] -= 1
+            self._reserved[job.target_volume] -= job.size
+        self._changed.set()
+
+    @staticmethod
+    def _limit(device, limit):
+        return 1 if device.rotational else limit
@@ -1,10 +1,23 @@
 import argparse
+import json
+import logging
 import os
+import sys
 
 from dotenv import load_dotenv
 
-from library import get_games_dict, get_game_from_dict, process_game
-from utils import close_process
+from batch import MoveBatch
+from devices import describe_device, get_device
+from filelist import get_manifest_files
+from library import get_games_dict, get_game_from_dict, get_library_dir, get_target_dir, process_game
+from planner import build_plan, load_plan, log_plan, save_plan
+from progress import JsonLinesSubscriber, get_progress
+from rebalance import get_min_free, get_quotas, plan_rebalance
+from throttle import MOVE_LOW_PRIORITY, get_rate_limiter, set_low_priority
+from tier import TIER_SKIP_IF_RUNNING, plan_tier, tier_lock
+from trash import get_trash
+from utils import close_process, is_process_running
+from verify import VERIFY_MODES
 from logger import setup_logger
 
 load_dotenv()
@@ -12,9 +25,9 @@ load_dotenv()
 LIBRARY_SOURCE = os.getenv('LIBRARY_SOURCE', 'nile')
 UPDATE_AG_MANIFEST = os.getenv('UPDATE_AG_MANIFEST', 'False').lower() == "true"
 UPDATE_NILE_MANIFEST = os.getenv('UPDATE_NILE_MANIFEST', 'True').lower() == "true"
-INSTALL_DIR_OPTIONS = os.getenv('INSTALL_DIR_OPTIONS').split(',')
+INSTALL_DIR_OPTIONS = os.getenv('INSTALL_DIR_OPTIONS', '').split(',')
 
-logger = setup_logger(log_name='ag_library_manager')
+logger = logging.getLogger()
 
 
 def list_games(games_dict):
@@ -31,6 +44,32 @@ def list_games(games_dict):
     logger.info(f"\nListed {total_games} games across {len(games_dict)} locations")
 
 
+def run_plan(plan, games_dict, workers=None, games=None):
+    """
+    Move the games of a plan that fit, in plan order, skipping games that were moved since it was made.
+    """
+    moves = []
+    for planned in plan['moves']:
+        if not planned['fits']:
+            logger.warning(f"Skipping '{planned['name']}', it did not fit when the plan was made.")
+            continue
+        game = get_game_from_dict(games_dict, planned['game_id'])
+        if not game:
+            logger.error(f"Game with ID '{planned['game_id']}' not found, skipping it.")
+            continue
+        if os.path.normcase(game.install_dir) != os.path.normcase(planned['source_dir']):
+            logger.warning(f"'{game.name}' was moved since the plan was made, skipping it.")
+            continue
+        moves.append((game, planned['target_base_dir'], planned['size'] if planned['method'] == 'copy' else 0))
+
+    if not moves:
+        logger.info("Nothing to move.")
+        return []
+
+    close_process('Amazon Games.exe')
+    return MoveBatch(process_game, games=games).run(moves, workers=workers, verify_mode=plan['verify_mode'])
+
+
 def interactive(games_dict):
     """
     Interactive mode for game selection and movement.
@@ -44,7 +83,7 @@ def interactive(games_dict):
         logger.info("User selected to move all games")
 
         for index, location in enumerate(INSTALL_DIR_OPTIONS, start=1):
-            print(f"{index}. Option {index}: {location}")
+            print(f"{index}. Option {index}: {location} [{describe_device(get_device(location))}]")
 
         try:
             desired_option = int(input(f"\nEnter your choice (1-{len(INSTALL_DIR_OPTIONS)}): "))
@@ -56,13 +95,8 @@ def interactive(games_dict):
 
                 close_process('Amazon Games.exe')
 
-                total_games = sum(len(games) for games in games_dict.values())
-                current_game = 0
-                for _, games in games_dict.items():
-                    for game in games:
-                        current_game += 1
-                        logger.info(f"Moving game {current_game}/{total_games}: {game.name}")
-                        process_game(game, desired_base_dir)
+                moves = [(game, desired_base_dir) for games in games_dict.values() for game in games]
+                MoveBatch(process_game).run(moves)
             else:
                 logger.warning(f"Invalid choice: {desired_option}")
 
@@ -86,7 +120,7 @@ def interactive(games_dict):
                 logger.info("\nChoose a preferred installation location option:")
 
                 for index, location in enumerate(INSTALL_DIR_OPTIONS, start=1):
-                    logger.info(f"{index}. Option {index}: {location}")
+                    logger.info(f"{index}. Option {index}: {location} [{describe_device(get_device(location))}]")
 
                 try:
                     desired_option = int(input(f"\nEnter your choice (1-{len(INSTALL_DIR_OPTIONS)}): "))
@@ -112,23 +146,140 @@ def interactive(games_dict):
 
 
 def main():
-    logger.info("=== Amazon Games Library Manager Started ===")
-    logger.info(f"Library source: {LIBRARY_SOURCE}")
-    logger.info(f"Update AG manifest: {UPDATE_AG_MANIFEST}")
-    logger.info(f"Update Nile manifest: {UPDATE_NILE_MANIFEST}")
-
     parser = argparse.ArgumentParser(description="Amazon Games Library Manager CLI")
     subparsers = parser.add_subparsers(title="subcommands", dest="command")
 
     subparsers.add_parser("list", help="List all games currently recognized by Amazon Games.")
 
     move_parser = subparsers.add_parser("move", help="Move a game to a different location.")
-    move_parser.add_argument("game_id", help="Game ID to move.")
+    move_parser.add_argument("game_id", nargs="+", help="Game IDs to move.")
     move_parser.add_argument("desired_base_dir", help="Desired base directory.")
+    move_parser.add_argument("--workers", type=int, help="Number of files to copy in parallel (overrides COPY_WORKERS).")
+    move_parser.add_argument("--games", type=int, help="Number of games to move at once (overrides MOVE_GAMES).")
+    move_parser.add_argument("--verify", choices=VERIFY_MODES, help="Copy verification mode (overrides VERIFY_MODE).")
+    move_parser.add_argument(
+        "--max-mbps", type=float, help="Copy bandwidth limit in MB/s, 0 for none (overrides MOVE_MAX_MBPS)."
+    )
+    move_parser.add_argument("--low-priority", action="store_true", help="Copy with idle CPU and I/O priority.")
+    move_parser.add_argument(
+        "--progress-json", help="Append progress events as JSON lines to this file, or '-' for stdout."
+    )
+
+    plan_parser = subparsers.add_parser("plan", help="Plan moving games without moving anything.")
+    plan_parser.add_argument("desired_base_dir", help="Desired base directory.")
+    plan_parser.add_argument("game_id", nargs="*", help="Game IDs to plan for, all games if none are given.")
+    plan_parser.add_argument("--verify", choices=VERIFY_MODES, help="Copy verification mode (overrides VERIFY_MODE).")
+    plan_parser.add_argument("--scan", action="store_true", help="Measure games by scanning their install directories.")
+    plan_parser.add_argument("--json", action="store_true", help="Print the plan as JSON.")
+    plan_parser.add_argument("--output", help="Save the plan to this file, for the execute subcommand.")
+
+    rebalance_parser = subparsers.add_parser(
+        "rebalance", help="Spread games over INSTALL_DIR_OPTIONS evenly, moving as few bytes as possible."
+    )
+    rebalance_parser.add_argument(
+        "--quota", action="append", metavar="PATH=GB",
+        help="Most GB of games in a location (overrides REBALANCE_QUOTAS)."
+    )
+    rebalance_parser.add_argument(
+        "--min-free", action="append", metavar="PATH=RATIO",
+        help="Least free ratio to leave on a location (overrides REBALANCE_MIN_FREE)."
+    )
+    rebalance_parser.add_argument("--dry-run", action="store_true", help="Only show the plan, without moving anything.")
+    rebalance_parser.add_argument(
+        "--scan", action="store_true", help="Measure games by scanning their install directories."
+    )
+    rebalance_parser.add_argument("--json", action="store_true", help="Print the plan as JSON.")
+    rebalance_parser.add_argument("--output", help="Save the plan to this file, for the execute subcommand.")
+    rebalance_parser.add_argument(
+        "--verify", choices=VERIFY_MODES, help="Copy verification mode (overrides VERIFY_MODE)."
+    )
+    rebalance_parser.add_argument(
+        "--workers", type=int, help="Number of files to copy in parallel (overrides COPY_WORKERS)."
+    )
+    rebalance_parser.add_argument("--games", type=int, help="Number of games to move at once (overrides MOVE_GAMES).")
+    rebalance_parser.add_argument(
+        "--max-mbps", type=float, help="Copy bandwidth limit in MB/s, 0 for none (overrides MOVE_MAX_MBPS)."
+    )
+    rebalance_parser.add_argument("--low-priority", action="store_true", help="Copy with idle CPU and I/O priority.")
+    rebalance_parser.add_argument(
+        "--progress-json", help="Append progress events as JSON lines to this file, or '-' for stdout."
+    )
+
+    tier_parser = subparsers.add_parser(
+        "tier", help="Keep the most recently played games on the fastest location and the rest on slower ones."
+    )
+    tier_parser.add_argument(
+        "--hot-games", type=int, help="Most games to keep hot, 0 for no limit (overrides TIER_HOT_GAMES)."
+    )
+    tier_parser.add_argument(
+        "--hot-gb", type=float, help="Most GB of games to keep hot, 0 for no limit (overrides TIER_HOT_GB)."
+    )
+    tier_parser.add_argument("--hot-dir", help="Install location to keep hot games in (overrides TIER_HOT_DIR).")
+    tier_parser.add_argument(
+        "--margin", type=float,
+        help="How far past the limits hot games may fall before leaving, as a ratio (overrides TIER_MARGIN)."
+    )
+    tier_parser.add_argument(
+        "--close-launcher", action="store_true",
+        help="Close the launcher if it is running instead of doing nothing (overrides TIER_SKIP_IF_RUNNING)."
+    )
+    tier_parser.add_argument("--dry-run", action="store_true", help="Only show the plan, without moving anything.")
+    tier_parser.add_argument(
+        "--scan", action="store_true", help="Measure games by scanning their install directories."
+    )
+    tier_parser.add_argument("--json", action="store_true", help="Print the plan as JSON.")
+    tier_parser.add_argument("--output", help="Save the plan to this file, for the execute subcommand.")
+    tier_parser.add_argument("--verify", choices=VERIFY_MODES, help="Copy verification mode (overrides VERIFY_MODE).")
+    tier_parser.add_argument(
+        "--workers", type=int, help="Number of files to copy in parallel (overrides COPY_WORKERS)."
+    )
+    tier_parser.add_argument("--games", type=int, help="Number of games to move at once (overrides MOVE_GAMES).")
+    tier_parser.add_argument(
+        "--max-mbps", type=float, help="Copy bandwidth limit in MB/s, 0 for none (overrides MOVE_MAX_MBPS)."
+    )
+    tier_parser.add_argument("--low-priority", action="store_true", help="Copy with idle CPU and I/O priority.")
+    tier_parser.add_argument(
+        "--progress-json", help="Append progress events as JSON lines to this file, or '-' for stdout."
+    )
+
+    execute_parser = subparsers.add_parser("execute", help="Move games as laid out in a saved plan.")
+    execute_parser.add_argument("plan_file", help="Plan file saved by the plan subcommand.")
+    execute_parser.add_argument(
+        "--workers", type=int, help="Number of files to copy in parallel (overrides COPY_WORKERS)."
+    )
+    execute_parser.add_argument("--games", type=int, help="Number of games to move at once (overrides MOVE_GAMES).")
+    execute_parser.add_argument(
+        "--max-mbps", type=float, help="Copy bandwidth limit in MB/s, 0 for none (overrides MOVE_MAX_MBPS)."
+    )
+    execute_parser.add_argument("--low-priority", action="store_true", help="Copy with idle CPU and I/O priority.")
+    execute_parser.add_argument(
+        "--progress-json", help="Append progress events as JSON lines to this file, or '-' for stdout."
+    )
 
     args = parser.parse_args()
+
+    # Console logs go to stderr when stdout carries JSON.
+    json_stdout = getattr(args, 'json', False) or getattr(args, 'progress_json', None) == '-'
+    setup_logger(log_name='ag_library_manager', stream=sys.stderr if json_stdout else None)
+    logger.info("=== Amazon Games Library Manager Started ===")
+    logger.info(f"Library source: {LIBRARY_SOURCE}")
+    logger.info(f"Update AG manifest: {UPDATE_AG_MANIFEST}")
+    logger.info(f"Update Nile manifest: {UPDATE_NILE_MANIFEST}")
+
     logger.debug(f"Command line arguments: {args}")
 
+    if getattr(args, 'max_mbps', None) is not None:
+        get_rate_limiter().set_max_mbps(args.max_mbps)
+
+    if args.command not in ("list", "plan") and (MOVE_LOW_PRIORITY or getattr(args, 'low_priority', False)):
+        set_low_priority()
+
+    if getattr(args, 'progress_json', None):
+        get_progress().subscribe(JsonLinesSubscriber(args.progress_json))
+
+    if args.command not in ("list", "plan"):
+        get_trash().resume()
+
     try:
         if args.command == "list":
             logger.info("Running in list mode")
@@ -136,17 +287,129 @@ def main():
             list_games(games_dict)
 
         elif args.command == "move":
-            logger.info(f"Running in move mode, for game_id: {args.game_id}")
+            logger.info(f"Running in move mode, for game_id: {', '.join(args.game_id)}")
 
             games_dict = get_games_dict()
 
-            game = get_game_from_dict(games_dict, args.game_id)
-            if not game:
-                logger.error(f"Game with ID '{args.game_id}' not found.")
-                return
+            games = []
+            for game_id in args.game_id:
+                game = get_game_from_dict(games_dict, game_id)
+                if not game:
+                    logger.error(f"Game with ID '{game_id}' not found.")
+                    return
+                games.append(game)
 
             close_process('Amazon Games.exe')
-            process_game(game, args.desired_base_dir)
+            if len(games) == 1:
+                process_game(games[0], args.desired_base_dir, workers=args.workers, verify_mode=args.verify)
+            else:
+                MoveBatch(process_game, games=args.games).run(
+                    [(game, args.desired_base_dir) for game in games], workers=args.workers, verify_mode=args.verify
+                )
+
+        elif args.command == "plan":
+            logger.info(f"Running in plan mode, for target: {args.desired_base_dir}")
+
+            games_dict = get_games_dict()
+
+            if args.game_id:
+                games = []
+                for game_id in args.game_id:
+                    game = get_game_from_dict(games_dict, game_id)
+                    if not game:
+                        logger.error(f"Game with ID '{game_id}' not found.")
+                        return
+                    games.append(game)
+            else:
+                games = [game for base_dir_games in games_dict.values() for game in base_dir_games]
+
+            plan = build_plan(
+                'ag', [(game, args.desired_base_dir) for game in games], get_target_dir,
+                get_manifest_files=get_manifest_files, verify_mode=args.verify, scan=args.scan
+            )
+            if not args.json:
+                log_plan(plan)
+            if args.output:
+                save_plan(plan, args.output)
+            if args.json:
+                print(json.dumps(plan, indent=4))
+
+        elif args.command == "execute":
+            logger.info(f"Running in execute mode, for plan: {args.plan_file}")
+
+            plan = load_plan(args.plan_file, 'ag')
+            games_dict = get_games_dict()
+            run_plan(plan, games_dict, workers=args.workers, games=args.games)
+
+        elif args.command == "rebalance":
+            logger.info("Running in rebalance mode")
+
+            games_dict = get_games_dict()
+            games = [game for base_dir_games in games_dict.values() for game in base_dir_games]
+
+            moves, sizes = plan_rebalance(
+                games, INSTALL_DIR_OPTIONS, get_library_dir, get_manifest_files=get_manifest_files, scan=args.scan,
+                quotas=get_quotas(args.quota), min_free=get_min_free(args.min_free)
+            )
+            if not moves:
+                logger.info("The library is balanced, nothing to move.")
+                return
+
+            plan = build_plan(
+                'ag', moves, get_target_dir, get_manifest_files=get_manifest_files, verify_mode=args.verify,
+                scan=args.scan, sizes=sizes
+            )
+            if not args.json:
+                log_plan(plan)
+            if args.output:
+                save_plan(plan, args.output)
+            if args.json:
+                print(json.dumps(plan, indent=4))
+            if not args.dry_run:
+                run_plan(plan, games_dict, workers=args.workers, games=args.games)
+
+        elif args.command == "tier":
+            logger.info("Running in tier mode")
+
+            with tier_lock() as locked:
+                if not locked:
+                    logger.warning("Another tier run is in progress, nothing to do.")
+                    return
+                skip_if_running = TIER_SKIP_IF_RUNNING and not args.close_launcher
+                if skip_if_running and is_process_running('Amazon Games.exe'):
+                    logger.info("Amazon Games.exe is running, nothing to do.")
+                    return
+
+                games_dict = get_games_dict()
+                games = [game for base_dir_games in games_dict.values() for game in base_dir_games]
+
+                moves, sizes = plan_tier(
+                    games, INSTALL_DIR_OPTIONS, get_library_dir, get_manifest_files=get_manifest_files, scan=args.scan,
+                    hot_games=args.hot_games,
+                    hot_size=int(args.hot_gb * 1024 ** 3) if args.hot_gb is not None else None,
+                    hot_dir=args.hot_dir, margin=args.margin
+                )
+                if not moves:
+                    logger.info("Every game is on its tier, nothing to move.")
+                    return
+
+                plan = build_plan(
+                    'ag', moves, get_target_dir, get_manifest_files=get_manifest_files,
+                    verify_mode=args.verify, scan=args.scan, sizes=sizes
+                )
+                if not args.json:
+                    log_plan(plan)
+                if args.output:
+                    save_plan(plan, args.output)
+                if args.json:
+                    print(json.dumps(plan, indent=4))
+                if args.dry_run:
+                    return
+                # Planning can take a while, so check again before closing the launcher.
+                if skip_if_running and is_process_running('Amazon Games.exe'):
+                    logger.info("Amazon Games.exe was started while planning, nothing moved.")
+                    return
+                run_plan(plan, games_dict, workers=args.workers, games=args.games)
 
         else:
             logger.info("Running in interactive mode")
@@ -159,6 +422,7 @@ def main():
         raise
 
     finally:
+        get_trash().wait()
         logger.info("=== Amazon Games Library Manager Finished ===")
 
 
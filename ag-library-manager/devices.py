@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HDD_COPY_WORKERS = int(os.getenv('HDD_COPY_WORKERS', '2'))
+THROUGHPUT_HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'throughput.json')
+THROUGHPUT_HISTORY_WEIGHT = 0.3
+
+Device = namedtuple('Device', ['name', 'rotational'])
+
+logger = logging.getLogger(__name__)
+
+_slots = {}
+_slots_lock = threading.Lock()
+_throughput_lock = threading.Lock()
+
+
+def get_device(path):
+    """
+    Resolve the physical disk behind path, or the nearest existing parent of it.
+
+    Partitions, device-mapper and md volumes resolve to their underlying disk. rotational is None when unknown.
+    """
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent_path = os.path.dirname(path)
+        if parent_path == path:
+            break
+        path = parent_path
+
+    try:
+        st_dev = os.stat(path).st_dev
+    except OSError as e:
+        logger.warning(f"Failed to stat '{path}' to resolve its device: {e}")
+        return Device(path, None)
+
+    if sys.platform == 'win32':
+        drive = os.path.splitdrive(path)[0]
+        if len(drive) != 2 or not drive[0].isalpha():
+            return Device(drive or path, None)
+        return _get_windows_device(drive[0].upper())
+    if sys.platform.startswith('linux'):
+        return _get_linux_device(st_dev)
+    return Device(str(st_dev), None)
+
+
+def device_workers(device, workers):
+    """
+    Limit the number of files copied at once to or from a device, so seeks do not thrash a spinning disk.
+    """
+    if device.rotational:
+        return max(1, min(workers, HDD_COPY_WORKERS))
+    return max(1, workers)
+
+
+def describe_device(device):
+    kind = {True: 'HDD', False: 'SSD', None: 'unknown'}[device.rotational]
+    return f"{device.name} ({kind})"
+
+
+class DeviceSlots:
+    """
+    Hold one I/O slot on each spinning disk among the given devices while a file is copied.
+
+    Slots are shared by every copy in the process, so concurrent copies never oversubscribe a disk.
+    """
+
+    def __init__(self, devices):
+        devices = {device.name: device for device in devices if device.rotational}
+        self.semaphores = [_get_slots(devices[name]) for name in sorted(devices)]
+
+    def __enter__(self):
+        for semaphore in self.semaphores:
+            semaphore.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for semaphore in reversed(self.semaphores):
+            semaphore.release()
+
+
+def get_throughput(source, target):
+    """
+    Return the throughput in bytes per second measured by earlier copies from source to target, or None.
+    """
+    with _throughput_lock:
+        return _read_throughput_history().get(f"{source.name}->{target.name}")
+
+
+def record_throughput(source, target, size, seconds):
+    """
+    Fold the throughput of a finished copy into the moving average kept for its pair of disks.
+    """
+    if not size or seconds <= 0:
+        return
+
+    key = f"{source.name}->{target.name}"
+    throughput = size / seconds
+    with _throughput_lock:
+        history = _read_throughput_history()
+        if key in history:
+            throughput = history[key] + THROUGHPUT_HISTORY_WEIGHT * (throughput - history[key])
+        history[key] = throughput
+
+        try:
+            with open(THROUGHPUT_HISTORY_PATH, 'w', encoding='utf-8') as f:
+                json.dump(history, f, indent=4)
+        except OSError as e:
+            logger.warning(f"Failed to save throughput history {THROUGHPUT_HISTORY_PATH}: {e}")
+
+
+def _read_throughput_history():
+    try:
+        with open(THROUGHPUT_HISTORY_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring throughput history {THROUGHPUT_HISTORY_PATH}: {e}")
+        return {}
+
+
+def _get_slots(device):
+    with _slots_lock:
+        if device.name not in _slots:
+            _slots[device.name] = threading.BoundedSemaphore(max(1, HDD_COPY_WORKERS))
+        return _slots[device.name]
+
+
+@lru_cache(maxsize=None)
+def _get_linux_device(st_dev):
+    device_id = f"{os.major(st_dev)}:{os.minor(st_dev)}"
+    block_dir = f"/sys/dev/block/{device_id}"
+
+    if not os.path.exists(block_dir):
+        source = _get_mount_source(device_id)
+        if not source or not os.path.exists(f"/sys/class/block/{source}"):
+            return Device(device_id, None)
+        block_dir = f"/sys/class/block/{source}"
+
+    disk_dir = _get_disk_dir(block_dir)
+    return Device(os.path.basename(disk_dir), _is_rotational(disk_dir))
+
+
+def _get_disk_dir(block_dir):
+    block_dir = os.path.realpath(block_dir)
+    if os.path.exists(os.path.join(block_dir, 'partition')):
+        return os.path.dirname(block_dir)
+    return block_dir
+
+
+def _is_rotational(disk_dir):
+    slaves_dir = os.path.join(disk_dir, 'slaves')
+    slaves = os.listdir(slaves_dir) if os.path.isdir(slaves_dir) else []
+    if slaves:
+        rotational = [_is_rotational(_get_disk_dir(os.path.join(slaves_dir, slave))) for slave in slaves]
+        return None if None in rotational else any(rotational)
+
+    try:
+        with open(os.path.join(disk_dir, 'queue', 'rotational')) as f:
+            return f.read().strip() == '1'
+    except OSError:
+        return None
+
+
+def _get_mount_source(device_id):
+    try:
+        with open('/proc/self/mountinfo') as f:
+            for line in f:
+                fields, _, mount = line.partition(' - ')
+                fields, mount = fields.split(), mount.split()
+                if fields[2] == device_id and len(mount) > 1 and mount[1].startswith('/dev/'):
+                    return os.path.basename(os.path.realpath(mount[1]))
+    except OSError:
+        pass
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def _get_windows_device(drive_letter):
+    command = (
+        f"$p = Get-Partition -DriveLetter {drive_letter}; "
+        f"$d = Get-PhysicalDisk | Where-Object DeviceId -eq $p.DiskNumber; "
+        f"\"$($p.DiskNumber) $($d.MediaType)\""
+    )
+
+    try:
+        result = subprocess.run(
+            ["powershell", "-NoProfile", "-Command", command],
+            capture_output=True,
+            text=True,
+            check=False,
+            timeout=30
+        )
+        disk_number, _, media_type = result.stdout.strip().partition(' ')
+    except Exception as e:
+        logger.warning(f"Failed to query the disk behind drive {drive_letter}: {e}")
+        return Device(f"{drive_letter}:", None)
+
+    if result.returncode != 0 or not disk_number:
+        return Device(f"{drive_letter}:", None)
+
+    rotational = {'HDD': True, 'SSD': False}.get(media_type.strip())
+    return Device(f"PhysicalDisk{disk_number}", rotational)
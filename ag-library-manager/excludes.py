@@ -0,0 +1,81 @@
+import logging
+import os
+import re
+
+from dotenv import load_dotenv
+
+from inventory import TreeInventory
+
+load_dotenv()
+
+MOVE_EXCLUDE = [pattern.strip() for pattern in os.getenv('MOVE_EXCLUDE', '').split(',') if pattern.strip()]
+MOVE_EXCLUDE_DEFAULTS = os.getenv('MOVE_EXCLUDE_DEFAULTS', 'True').lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+
+class ExcludeRules:
+    """
+    Path patterns for regenerable data that is left behind when a game is copied.
+
+    Patterns use '/' as separator and support '*' and '?' within a path component. A pattern starting with '/' is
+    anchored at the install directory, any other pattern matches at any depth. Matching a directory excludes everything
+    below it, and matching ignores case.
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = list(patterns)
+        self._regex = None
+        if self.patterns:
+            self._regex = re.compile('|'.join(_translate(pattern) for pattern in self.patterns), re.IGNORECASE)
+
+    @classmethod
+    def from_env(cls, defaults=()):
+        """
+        Combine the launcher's default patterns, unless MOVE_EXCLUDE_DEFAULTS is off, with MOVE_EXCLUDE.
+        """
+        return cls((list(defaults) if MOVE_EXCLUDE_DEFAULTS else []) + MOVE_EXCLUDE)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def matches(self, rel_path):
+        if self._regex is None:
+            return False
+        return self._regex.search(rel_path.replace(os.sep, '/')) is not None
+
+    def apply(self, inventory):
+        """
+        Return a copy of inventory without the excluded files and directories, and the file entries left out.
+        """
+        if not self:
+            return inventory, []
+
+        included = TreeInventory(inventory.root)
+        included.dirs = [rel_dir for rel_dir in inventory.dirs if not rel_dir or not self.matches(rel_dir)]
+        included.linked_dirs = {rel_dir for rel_dir in inventory.linked_dirs if not self.matches(rel_dir)}
+
+        excluded = []
+        for entry in inventory.files:
+            (excluded if self.matches(entry.path) else included.files).append(entry)
+
+        if excluded:
+            logger.info(
+                f"Excluding {len(excluded)} files ({sum(entry.size for entry in excluded) / (1024 ** 3):.2f} GB) "
+                f"of '{inventory.root}' matching: {', '.join(self.patterns)}"
+            )
+
+        return included, excluded
+
+
+def _translate(pattern):
+    pattern = pattern.replace('\\', '/')
+    anchored = pattern.startswith('/')
+    parts = [part for part in pattern.split('/') if part]
+
+    regex = '/'.join(
+        ''.join('[^/]*' if char == '*' else '[^/]' if char == '?' else re.escape(char) for char in part)
+        for part in parts
+    )
+
+    return f"{'^' if anchored else '(?:^|/)'}{regex}(?:/|$)"
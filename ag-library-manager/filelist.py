@@ -0,0 +1,13 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_manifest_files(game):
+    """
+    Get the files the launcher expects in the game's install directory.
+
+    Amazon Games and nile do not keep per-file sizes or hashes locally, so there is no list to return.
+    """
+    logger.warning(f"Amazon Games does not provide a file manifest for game '{game.name}'")
+    return None
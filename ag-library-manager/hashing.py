@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import os
+
+from dotenv import load_dotenv
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+load_dotenv()
+
+HASH_ALGORITHM = os.getenv('HASH_ALGORITHM', 'auto').lower()
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def available_algorithms():
+    """
+    List the streaming hash algorithms that can be used, fastest first.
+    """
+    algorithms = []
+    if xxhash is not None:
+        algorithms.append('xxh3')
+    if blake3 is not None:
+        algorithms.append('blake3')
+    algorithms.append('blake2b')
+    return algorithms
+
+
+def is_available(algorithm):
+    return algorithm in available_algorithms() or algorithm in hashlib.algorithms_guaranteed
+
+
+def resolve_algorithm(algorithm=None):
+    algorithm = (algorithm or HASH_ALGORITHM).lower()
+    available = available_algorithms()
+
+    if algorithm == 'auto':
+        return available[0]
+
+    if not is_available(algorithm):
+        logger.warning(f"Hash algorithm '{algorithm}' is not installed, using '{available[0]}'")
+        return available[0]
+
+    return algorithm
+
+
+def new_hasher(algorithm=None):
+    algorithm = resolve_algorithm(algorithm)
+
+    if algorithm == 'xxh3':
+        return xxhash.xxh3_128()
+    if algorithm == 'blake3':
+        return blake3.blake3()
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algorithm)
+
+
+def format_digest(algorithm, hasher):
+    return f"{algorithm}:{hasher.hexdigest()}"
+
+
+def digest_algorithm(digest):
+    return digest.split(':', 1)[0]
+
+
+def hash_file(path, algorithm=None, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Stream a file through the configured hash and return its digest, prefixed with the algorithm name.
+    """
+    algorithm = resolve_algorithm(algorithm)
+    hasher = new_hasher(algorithm)
+    with open(path, 'rb', buffering=0) as f:
+        with memoryview(bytearray(chunk_size)) as buffer:
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                hasher.update(buffer[:read])
+
+    return format_digest(algorithm, hasher)
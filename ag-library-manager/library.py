@@ -2,9 +2,20 @@ import logging
 import os
 from collections import defaultdict
 
+from excludes import ExcludeRules
 from fetch import fetch_games
+from filelist import get_manifest_files
 from manifest import update_manifest
-from utils import copy_directory, remove_dir_if_exists
+from pipeline import stage
+from utils import can_resume_copy, copy_directory, is_same_volume, move_directory, remove_dir_if_exists
+
+# Regenerable data left behind when a game is copied: crash dumps, logs.
+EXCLUDE_DEFAULTS = [
+    '*.dmp',
+    '*.mdmp',
+    'Saved/Crashes',
+    'Saved/Logs',
+]
 
 logger = logging.getLogger(__name__)
 
@@ -47,7 +58,21 @@ def get_game_from_dict(games_dict, lookup_value, by_index=False):
     return None
 
 
-def process_game(game, target_base_dir):
+def get_library_dir(game):
+    """
+    Get the library the game is installed in, as listed in INSTALL_DIR_OPTIONS.
+    """
+    return game.base_dir
+
+
+def get_target_dir(game, target_base_dir):
+    """
+    Get the directory the game is installed to when moved to target_base_dir.
+    """
+    return os.path.join(target_base_dir, os.path.basename(game.install_dir))
+
+
+def process_game(game, target_base_dir, workers=None, verify_mode=None):
     """
     Process the game, including copying files, updating the manifest, and cleaning up old files.
     """
@@ -55,37 +80,59 @@ def process_game(game, target_base_dir):
         logger.error(f"Source game directory does not exist: {game.install_dir}")
         return False
 
-    target_dir = os.path.join(target_base_dir, os.path.basename(game.install_dir))
+    target_dir = get_target_dir(game, target_base_dir)
+
+    if os.path.normcase(os.path.abspath(target_dir)) == os.path.normcase(os.path.abspath(game.install_dir)):
+        logger.info(f"Game '{game.name}' is already installed in: {target_dir}")
+        return True
+
+    exclude = ExcludeRules.from_env(EXCLUDE_DEFAULTS)
 
-    if os.path.exists(target_dir):
+    if os.path.exists(target_dir) and not can_resume_copy(game.install_dir, target_dir, exclude):
         logger.error(f"Target game directory already exists: {target_dir}")
         return False
 
     original_install_dir, original_base_dir = game.get_dirs()
+    renamed = False
 
     def rollback():
         game.set_dirs(original_install_dir, original_base_dir)
-        remove_dir_if_exists(target_dir)
+        if renamed:
+            move_directory(target_dir, original_install_dir)
+        else:
+            remove_dir_if_exists(target_dir, background=True)
 
     try:
-        if not copy_directory(game.install_dir, target_dir):
-            logger.error(f"Failed to copy directory for game '{game.name}'")
-            rollback()
-            return False
+        if not os.path.exists(target_dir) and is_same_volume(game.install_dir, target_base_dir):
+            logger.info(f"Source and target share a volume, renaming directory for game '{game.name}'")
+            renamed = move_directory(game.install_dir, target_dir)
 
-        logger.info(f"Successfully copied directory for game '{game.name}'")
+        if not renamed:
+            scanned = []
+            if not copy_directory(
+                    game.install_dir, target_dir, workers=workers, verify_mode=verify_mode,
+                    manifest_files=lambda: get_manifest_files(game), exclude=exclude, name=game.name,
+                    on_scan=scanned.append
+            ):
+                logger.error(f"Failed to copy directory for game '{game.name}'")
+                return False
 
-        game.set_dirs(target_dir, target_base_dir)
+        logger.info(f"Successfully {'renamed' if renamed else 'copied'} directory for game '{game.name}'")
 
-        if not update_manifest(game):
-            logger.error(f"Failed to update manifest for game '{game.name}'")
-            rollback()
-            return False
+        with stage('commit'):
+            game.set_dirs(target_dir, target_base_dir)
 
-        logger.info(f"Successfully updated manifest for game '{game.name}'")
+            if not update_manifest(game):
+                logger.error(f"Failed to update manifest for game '{game.name}'")
+                rollback()
+                return False
 
-        remove_dir_if_exists(original_install_dir)
-        return True
+            logger.info(f"Successfully updated manifest for game '{game.name}'")
+
+            if not renamed:
+                remove_dir_if_exists(original_install_dir, scanned[0] if scanned else None, workers, background=True)
+
+            return True
 
     except Exception as e:
         logger.error(f"Unexpected error processing game '{game.name}': {e}")
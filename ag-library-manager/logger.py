@@ -4,9 +4,9 @@ import sys
 from datetime import datetime
 
 
-def setup_logger(log_name='app_log'):
+def setup_logger(log_name='app_log', stream=None):
     """
-    Set up logging configuration with both file and console handlers.
+    Set up logging configuration with both file and console handlers, the console one writing to stream or stdout.
     """
     logger = logging.getLogger()
 
@@ -49,7 +49,7 @@ def setup_logger(log_name='app_log'):
     except (OSError, IOError) as e:
         print(f"Warning: Could not create log file {log_file}: {e}", file=sys.stderr)
 
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = logging.StreamHandler(stream or sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(simple_formatter)
     logger.addHandler(console_handler)
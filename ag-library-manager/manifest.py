@@ -1,6 +1,7 @@
 import logging
 import os
 import sqlite3
+import threading
 
 from dotenv import load_dotenv
 
@@ -15,19 +16,24 @@ UPDATE_NILE_MANIFEST = os.getenv('UPDATE_NILE_MANIFEST', 'False').lower() == "tr
 
 logger = logging.getLogger(__name__)
 
+_manifest_lock = threading.Lock()
+
 
 def update_manifest(game):
     """
     Update manifest files with the new game location.
+
+    The launcher files list every game, so updates from games moved at once are made one at a time.
     """
     success = True
 
-    if UPDATE_AG_MANIFEST:
-        success &= _update_ag_asin(game)
-        success &= _update_ag_manifest(game)
+    with _manifest_lock:
+        if UPDATE_AG_MANIFEST:
+            success &= _update_ag_asin(game)
+            success &= _update_ag_manifest(game)
 
-    if UPDATE_NILE_MANIFEST:
-        success &= _update_nile_manifest(game)
+        if UPDATE_NILE_MANIFEST:
+            success &= _update_nile_manifest(game)
 
     return success
 
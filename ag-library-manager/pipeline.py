@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MOVE_COPY_GAMES = int(os.getenv('MOVE_COPY_GAMES') or '0')
+MOVE_VERIFY_GAMES = int(os.getenv('MOVE_VERIFY_GAMES', '2'))
+MOVE_COMMIT_GAMES = int(os.getenv('MOVE_COMMIT_GAMES', '1'))
+MOVE_STAGE_QUEUE = int(os.getenv('MOVE_STAGE_QUEUE', '1'))
+
+STAGES = ('copy', 'verify', 'commit')
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def stage(name):
+    """
+    Run the enclosed step of a game move as the named stage of the pipeline the current thread belongs to.
+
+    Outside a batch move this does nothing, so single moves run their steps back to back as before.
+    """
+    pipeline = getattr(_local, 'pipeline', None)
+    if pipeline is None:
+        return nullcontext()
+    return _StageContext(pipeline, pipeline.stages[name])
+
+
+class Stage:
+    """
+    One step of a game move, with a limited number of games in it and a bounded queue of games waiting for it.
+    """
+
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.slots = threading.BoundedSemaphore(self.workers)
+        self.queue = threading.BoundedSemaphore(self.queue_size)
+        self.games = 0
+        self.busy = 0.0
+        self.waited = 0.0
+        self.waiting = 0
+        self.max_waiting = 0
+
+
+class StagePipeline:
+    """
+    Overlap the copy, verify and commit stages of the games in a batch move, so one game can be copied while the
+    previous one is verified and the one before that has its manifest updated and its source removed.
+
+    A game keeps its slot in a stage until it has a place in the next stage's queue, so a full queue holds back the
+    stages before it.
+    """
+
+    def __init__(self, copy_games=None, verify_games=None, commit_games=None, queue_size=None):
+        self.stages = {
+            'copy': Stage('copy', copy_games or MOVE_COPY_GAMES or 1, queue_size or MOVE_STAGE_QUEUE),
+            'verify': Stage('verify', verify_games or MOVE_VERIFY_GAMES, queue_size or MOVE_STAGE_QUEUE),
+            'commit': Stage('commit', commit_games or MOVE_COMMIT_GAMES, queue_size or MOVE_STAGE_QUEUE),
+        }
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def bind(self, on_release=None):
+        """
+        Make stage() in the current thread refer to this pipeline, for the game the thread is about to move.
+
+        on_release(stage name) is called in this thread whenever the game gives up a stage slot.
+        """
+        _local.pipeline = self
+        _local.held = None
+        _local.on_release = on_release
+
+    def unbind(self):
+        """
+        Give up the slot still held by the current thread's game and detach the thread from the pipeline.
+        """
+        self._release_held()
+        _local.pipeline = None
+
+    def log_summary(self):
+        """
+        Log the games, busy time, utilization and queueing of each stage.
+        """
+        elapsed = time.monotonic() - self.started
+        for name in STAGES:
+            stage = self.stages[name]
+            utilization = stage.busy / (stage.workers * elapsed) if elapsed else 0.0
+            average_wait = stage.waited / stage.games if stage.games else 0.0
+            logger.info(
+                f"Stage '{name}': {stage.games} games on {stage.workers} slots, busy {stage.busy:.1f}s "
+                f"({utilization:.0%} utilization), waited {average_wait:.1f}s on average, "
+                f"at most {stage.max_waiting} queued"
+            )
+
+    def _enter(self, stage):
+        start_time = time.monotonic()
+        stage.queue.acquire()
+        with self._lock:
+            stage.waiting += 1
+            stage.max_waiting = max(stage.max_waiting, stage.waiting)
+
+        self._release_held()
+        stage.slots.acquire()
+
+        with self._lock:
+            stage.waiting -= 1
+        stage.queue.release()
+
+        entered = time.monotonic()
+        with self._lock:
+            stage.waited += entered - start_time
+        return entered
+
+    def _exit(self, stage, entered):
+        with self._lock:
+            stage.games += 1
+            stage.busy += time.monotonic() - entered
+        _local.held = stage
+
+    def _release_held(self):
+        stage = getattr(_local, 'held', None)
+        if stage is None:
+            return
+
+        _local.held = None
+        stage.slots.release()
+        if _local.on_release:
+            _local.on_release(stage.name)
+
+
+class _StageContext:
+    def __init__(self, pipeline, stage):
+        self.pipeline = pipeline
+        self.stage = stage
+        self.entered = None
+
+    def __enter__(self):
+        self.entered = self.pipeline._enter(self.stage)
+        return self.stage
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.pipeline._exit(self.stage, self.entered)
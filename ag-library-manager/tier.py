@@ -0,0 +1,213 @@
+import glob
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from devices import describe_device, get_device
+from planner import get_device_mbps
+from rebalance import get_locations, measure_games
+from utils import get_volume
+
+load_dotenv()
+
+TIER_HOT_DIR = os.getenv('TIER_HOT_DIR', '')
+TIER_HOT_GAMES = int(os.getenv('TIER_HOT_GAMES') or '10')
+TIER_HOT_SIZE = int(float(os.getenv('TIER_HOT_GB') or '0') * 1024 ** 3)
+TIER_MARGIN = float(os.getenv('TIER_MARGIN', '0.25'))
+TIER_MIN_IDLE_HOURS = float(os.getenv('TIER_MIN_IDLE_HOURS', '2'))
+TIER_SKIP_IF_RUNNING = os.getenv('TIER_SKIP_IF_RUNNING', 'True').lower() == "true"
+TIER_LOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tier.lock')
+
+logger = logging.getLogger(__name__)
+
+
+def get_last_played(game):
+    """
+    Get when a game was last played, in seconds since the epoch, or 0 if it never was.
+
+    Launchers that do not record it fall back to the last access of the game's executables, which is only as
+    accurate as the file system's access times.
+    """
+    last_played = getattr(game, 'last_played', None)
+    if last_played:
+        return last_played
+
+    last_used = 0
+    for path in glob.glob(os.path.join(glob.escape(game.install_dir), '*.exe')):
+        try:
+            last_used = max(last_used, os.stat(path).st_atime)
+        except OSError:
+            continue
+    return last_used
+
+
+def plan_tier(games, paths, get_library_dir, get_manifest_files=None, scan=False, hot_games=None, hot_size=None,
+              hot_dir=None, margin=None):
+    """
+    Keep the most recently played games on the fastest install location and the rest on the others.
+
+    At most hot_games games and hot_size bytes are kept hot, 0 meaning no limit besides the hot volume's room. To
+    limit churn between runs, games already hot only leave once they fall behind the limits widened by margin, and
+    games played in the last TIER_MIN_IDLE_HOURS, which may be running, are left where they are.
+
+    Returns the (game, target_base_dir) moves and the measured sizes, a dict of game_id to (size, files).
+    """
+    hot_games = TIER_HOT_GAMES if hot_games is None else hot_games
+    hot_size = TIER_HOT_SIZE if hot_size is None else hot_size
+    margin = TIER_MARGIN if margin is None else margin
+
+    sized = {game.game_id: (game.size, None) for game in games if getattr(game, 'size', None)}
+    sizes = measure_games([game for game in games if game.game_id not in sized], get_manifest_files, scan)
+    game_sizes = {game_id: size for game_id, (size, _) in {**sized, **sizes}.items()}
+
+    locations = get_locations(
+        paths, games, {game_id: (size, None) for game_id, size in game_sizes.items()}, get_library_dir
+    )
+    if len(locations) < 2:
+        logger.info("Tiering needs install locations on at least two volumes")
+        return [], sizes
+
+    hot = _pick_hot_location(locations, hot_dir or TIER_HOT_DIR)
+    if hot is None:
+        return [], sizes
+    cold = [location for location in locations if location is not hot]
+    logger.info(f"Hot location: '{hot.path}' ({describe_device(get_device(hot.path))})")
+
+    now = time.time()
+    last_played = {game.game_id: get_last_played(game) for location in locations for game in location.games}
+    ranked = sorted(
+        (game for location in locations for game in location.games if last_played[game.game_id]),
+        key=lambda game: (-last_played[game.game_id], game.name.lower())
+    )
+
+    budget = min(hot_size or hot.cap, hot.cap)
+    for game in ranked:
+        if game_sizes[game.game_id] > budget:
+            logger.info(f"'{game.name}' is larger than the room for hot games, leaving it out of the ranking")
+    ranked = [game for game in ranked if game_sizes[game.game_id] <= budget]
+
+    strict = _take(ranked, game_sizes, hot_games or len(ranked), budget)
+    loose = _take(
+        ranked, game_sizes, int((hot_games or len(ranked)) * (1 + margin)),
+        min(int((hot_size or hot.cap) * (1 + margin)), hot.cap)
+    )
+
+    strict, loose, current = set(strict), set(loose), set(hot.games)
+    keep = [game for game in hot.games if game in loose]
+    demote = [game for game in hot.games if game not in loose]
+    promote = [game for game in ranked if game in strict and game not in current]
+
+    rank = {game.game_id: index for index, game in enumerate(ranked)}
+    while keep and _total(keep + promote, game_sizes) > hot.cap:
+        extra = [game for game in keep if game not in strict]
+        if not extra:
+            break
+        game = max(extra, key=lambda game: rank[game.game_id])
+        keep.remove(game)
+        demote.append(game)
+
+    busy_since = now - TIER_MIN_IDLE_HOURS * 3600
+    for game in [game for game in demote + promote if last_played[game.game_id] > busy_since]:
+        logger.info(f"'{game.name}' was played in the last {TIER_MIN_IDLE_HOURS:g} hours, leaving it in place")
+        if game in demote:
+            demote.remove(game)
+        else:
+            promote.remove(game)
+
+    room = {location.volume: location.cap - location.games_size for location in locations}
+    moves = []
+    for game in sorted(demote, key=lambda game: -game_sizes[game.game_id]):
+        size = game_sizes[game.game_id]
+        candidates = [location for location in cold if room[location.volume] >= size]
+        if not candidates:
+            logger.warning(f"No slower location has room for '{game.name}', keeping it in '{hot.path}'")
+            continue
+
+        target = max(candidates, key=lambda location: room[location.volume])
+        room[target.volume] -= size
+        room[hot.volume] += size
+        moves.append((game, target.path))
+
+    for game in sorted(promote, key=lambda game: rank[game.game_id]):
+        size = game_sizes[game.game_id]
+        if room[hot.volume] < size:
+            logger.warning(f"Not enough room in '{hot.path}' for '{game.name}', leaving it in place")
+            continue
+
+        room[hot.volume] -= size
+        moves.append((game, hot.path))
+
+    promoted = sum(1 for _, target in moves if target == hot.path)
+    logger.info(
+        f"Tiering keeps {len(keep)} games hot, promotes {promoted} and demotes {len(moves) - promoted}, "
+        f"{_total([game for game, _ in moves], game_sizes) / 1024 ** 3:.2f} GB"
+    )
+    return moves, sizes
+
+
+@contextmanager
+def tier_lock(path=None):
+    """
+    Hold an exclusive lock for the duration of a tier run, yielding False when another run already holds it.
+
+    The lock is released by the operating system if the run dies, so a scheduled run never stays locked out.
+    """
+    lock_file = open(path or TIER_LOCK_PATH, 'a+')
+    try:
+        try:
+            if sys.platform == 'win32':
+                import msvcrt
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+
+        yield True
+    finally:
+        lock_file.close()
+
+
+def _pick_hot_location(locations, hot_dir):
+    if hot_dir:
+        if not os.path.isdir(hot_dir):
+            logger.error(f"Hot location '{hot_dir}' does not exist")
+            return None
+
+        volume = get_volume(hot_dir)
+        for location in locations:
+            if location.volume == volume:
+                location.path = hot_dir
+                return location
+
+        logger.error(f"Hot location '{hot_dir}' is not on the volume of any install location")
+        return None
+
+    def speed(location):
+        device = get_device(location.path)
+        return device.rotational is False, get_device_mbps(device)
+
+    return max(locations, key=speed)
+
+
+def _take(ranked, game_sizes, count, size):
+    taken = []
+    total = 0
+    for game in ranked:
+        # Stop at the first game that does not fit, so a less recently played game never takes the place of a more
+        # recently played one.
+        if len(taken) >= count or total + game_sizes[game.game_id] > size:
+            break
+        taken.append(game)
+        total += game_sizes[game.game_id]
+    return taken
+
+
+def _total(games, game_sizes):
+    return sum(game_sizes[game.game_id] for game in games)
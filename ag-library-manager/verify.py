@@ -0,0 +1,114 @@
+import filecmp
+import logging
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from hashing import digest_algorithm, hash_file, is_available
+
+load_dotenv()
+
+VERIFY_WORKERS = int(os.getenv('VERIFY_WORKERS', str(os.cpu_count() or 4)))
+VERIFY_SAMPLE_COUNT = int(os.getenv('VERIFY_SAMPLE_COUNT', '8'))
+VERIFY_SAMPLE_MIN_SIZE = 16 * 1024 * 1024
+VERIFY_SAMPLE_CHUNK_SIZE = 64 * 1024
+
+VERIFY_MODES = ('none', 'stat', 'sample', 'full', 'manifest')
+
+logger = logging.getLogger(__name__)
+
+
+def _stat_match(source_file, target_file, entry, target_entry):
+    if entry.mtime_ns == target_entry.mtime_ns:
+        return True
+
+    return filecmp.cmp(source_file, target_file, shallow=False)
+
+
+def _sample_match(source_file, target_file, size):
+    last_offset = size - VERIFY_SAMPLE_CHUNK_SIZE
+    offsets = {0, last_offset} | {random.randrange(0, last_offset) for _ in range(VERIFY_SAMPLE_COUNT)}
+
+    with open(source_file, 'rb') as fsrc, open(target_file, 'rb') as fdst:
+        for offset in sorted(offsets):
+            fsrc.seek(offset)
+            fdst.seek(offset)
+            if fsrc.read(VERIFY_SAMPLE_CHUNK_SIZE) != fdst.read(VERIFY_SAMPLE_CHUNK_SIZE):
+                return False
+
+    return True
+
+
+def _full_match(task):
+    source_file, target_file, digest = task
+    if not digest or not is_available(digest_algorithm(digest)):
+        digest = hash_file(source_file)
+
+    _drop_cache(target_file)
+    return hash_file(target_file, digest_algorithm(digest)) == digest
+
+
+def _drop_cache(path):
+    # Freshly written pages are still cached, and reading them back would only check memory, not the disk. Dirty
+    # pages are never dropped, so they are written back first.
+    if not hasattr(os, 'posix_fadvise'):
+        return
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def compare_files(
+        source_dir, target_dir, pairs, mode, cloned_files=frozenset(), digests=None, workers=None, manifest_files=None
+):
+    """
+    Compare (source entry, target entry) pairs with the given mode and return the relative paths that differ.
+
+    In 'manifest' mode, files listed by the launcher are checked against its size and SHA-1 instead of the source.
+    """
+    digests = digests or {}
+    manifest_files = manifest_files or {}
+    workers = max(1, workers or VERIFY_WORKERS)
+
+    different = []
+    sampled = []
+    hashed = []
+
+    for entry, target_entry in pairs:
+        source_file, target_file = os.path.join(source_dir, entry.path), os.path.join(target_dir, entry.path)
+        expected = manifest_files.get(os.path.normcase(entry.path)) if mode == 'manifest' else None
+
+        if entry.size != target_entry.size:
+            different.append(entry.path)
+        elif expected and expected[0] != target_entry.size:
+            different.append(entry.path)
+        elif expected and expected[1] and target_entry.size:
+            hashed.append((entry.path, (None, target_file, f"sha1:{expected[1]}")))
+        elif target_file in cloned_files:
+            continue
+        elif mode == 'full':
+            hashed.append((entry.path, (source_file, target_file, digests.get(target_file))))
+        elif mode == 'sample' and entry.size >= VERIFY_SAMPLE_MIN_SIZE:
+            sampled.append((entry.path, source_file, target_file, entry.size))
+        elif not _stat_match(source_file, target_file, entry, target_entry):
+            different.append(entry.path)
+
+    if sampled:
+        logger.info(f"Sampling {VERIFY_SAMPLE_COUNT} chunks from each of {len(sampled)} large files")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            matches = executor.map(lambda sample: _sample_match(*sample[1:]), sampled)
+            different.extend(sample[0] for sample, match in zip(sampled, matches) if not match)
+
+    if hashed:
+        logger.info(f"Hashing {len(hashed)} files on {workers} processes")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            matches = executor.map(_full_match, [task for _, task in hashed], chunksize=32)
+            different.extend(path for (path, _), match in zip(hashed, matches) if not match)
+
+    return different
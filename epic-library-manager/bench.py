@@ -0,0 +1,433 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from logger import setup_logger
+from transfer import available_backends
+from verify import VERIFY_MODES
+
+load_dotenv()
+
+BENCH_DIR = os.getenv('BENCH_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench')
+BENCH_SEED = int(os.getenv('BENCH_SEED', '0'))
+BENCH_POOL_SIZE = 16 * 1024 * 1024
+BENCH_WRITE_SIZE = 1024 * 1024
+
+PROFILES = ['tiny', 'archives', 'deep', 'sparse', 'mixed']
+VERIFY_ONLY_MODES = [mode for mode in VERIFY_MODES if mode not in ('none', 'manifest')]
+
+KB = 1024
+MB = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def generate_profile(profile, rng, scale=1.0):
+    """
+    List the files of a synthetic install tree as (relative path, size, data regions), where data regions is None
+    for a fully written file or a list of (offset, length) for a sparse one.
+    """
+    def count(n):
+        return max(1, int(n * scale))
+
+    def size(n):
+        return max(MB, int(n * scale))
+
+    files = []
+    if profile in ('tiny', 'mixed'):
+        for i in range(count(20000 if profile == 'tiny' else 5000)):
+            path = os.path.join('data', f"pak{i % 200:03d}", f"asset{i:06d}.bin")
+            files.append((path, rng.randint(KB, 16 * KB if profile == 'tiny' else 64 * KB), None))
+
+    if profile in ('deep', 'mixed'):
+        for i in range(count(2000 if profile == 'deep' else 500)):
+            depth = rng.randint(8, 24)
+            parts = [f"level{rng.randint(0, 3)}" for _ in range(depth)]
+            files.append((os.path.join('content', *parts, f"file{i:05d}.dat"), rng.randint(4 * KB, 64 * KB), None))
+
+    if profile == 'mixed':
+        for i in range(count(200)):
+            files.append((os.path.join('bin', f"module{i:03d}.dll"), rng.randint(MB, 8 * MB), None))
+
+    if profile in ('archives', 'mixed'):
+        for i in range(4 if profile == 'archives' else 2):
+            files.append((f"archive{i}.pak", size(256 * MB), None))
+
+    if profile in ('sparse', 'mixed'):
+        for i in range(4 if profile == 'sparse' else 1):
+            file_size = size(256 * MB)
+            regions = []
+            for _ in range(8):
+                length = rng.randint(MB, max(MB, file_size // 80))
+                regions.append((rng.randrange(0, file_size - length, 4096), length))
+            files.append((f"sparse{i}.img", file_size, sorted(regions)))
+
+    return files
+
+
+def prepare_tree(profile, scale, seed, bench_dir):
+    """
+    Generate a synthetic tree for profile, reusing the one on disk if it was built with the same parameters.
+    """
+    name = f"{profile}-{scale:g}-{seed}"
+    root = os.path.join(bench_dir, 'trees', name)
+    marker = f"{root}.json"
+    rng = random.Random(f"{profile}-{seed}")
+    files = generate_profile(profile, rng, scale)
+    spec = {'profile': profile, 'scale': scale, 'seed': seed, 'files': len(files), 'size': sum(f[1] for f in files)}
+
+    if os.path.exists(marker) and os.path.isdir(root):
+        with open(marker, 'r', encoding='utf-8') as f:
+            if json.load(f) == spec:
+                logger.info(f"Reusing synthetic tree '{root}'")
+                return root, spec
+
+    logger.info(f"Generating synthetic tree '{root}' ({spec['files']} files, {spec['size'] / (1024 ** 3):.2f} GB)")
+    if os.path.exists(root):
+        shutil.rmtree(root)
+
+    pool = rng.randbytes(BENCH_POOL_SIZE)
+
+    def write(f, offset, length):
+        f.seek(offset)
+        while length:
+            start = rng.randrange(0, BENCH_POOL_SIZE - BENCH_WRITE_SIZE)
+            chunk = min(length, BENCH_WRITE_SIZE)
+            f.write(pool[start:start + chunk])
+            length -= chunk
+
+    for path, file_size, regions in files:
+        file_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            for offset, length in regions or [(0, file_size)]:
+                write(f, offset, length)
+            f.truncate(file_size)
+
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, indent=4)
+
+    return root, spec
+
+
+def drop_cache(root):
+    """
+    Ask the kernel to evict the files below root from the page cache, so the next trial reads from disk.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            fd = os.open(os.path.join(dir_path, file_name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    return True
+
+
+def run_trial(trial, settings):
+    """
+    Run one trial in a fresh interpreter with settings in its environment, so module-level settings apply and the
+    peak RSS is its own.
+    """
+    env = dict(os.environ, **settings)
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--trial', json.dumps(trial)],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+
+    if result.returncode != 0:
+        logger.error(f"Trial {trial} failed: {result.stderr.strip()}")
+        return None
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _trial_main(trial):
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    import devices
+    import journal
+    from inventory import TreeInventory
+    from progress import TqdmSubscriber, get_progress
+    from utils import _verify_directory_copy, copy_directory
+
+    # Keep synthetic runs out of the journals and the throughput history the planner relies on.
+    journal.JOURNAL_DIR = os.path.join(trial['state'], 'journals')
+    devices.THROUGHPUT_HISTORY_PATH = os.path.join(trial['state'], 'throughput.json')
+
+    progress = get_progress()
+    for subscriber in list(progress.subscribers):
+        if isinstance(subscriber, TqdmSubscriber):
+            progress.unsubscribe(subscriber)
+
+    inventory = TreeInventory.scan(trial['source'], trial['workers'])
+    before = _usage()
+    start_time = time.monotonic()
+
+    if trial['phase'] == 'copy':
+        ok = copy_directory(
+            trial['source'], trial['target'], workers=trial['workers'], inventory=inventory, verify_mode='none'
+        )
+    else:
+        ok = _verify_directory_copy(
+            trial['source'], trial['target'], inventory=inventory, workers=trial['workers'], mode=trial['verify']
+        )
+
+    seconds = time.monotonic() - start_time
+    after = _usage()
+
+    result = {
+        'ok': bool(ok),
+        'seconds': seconds,
+        'bytes': inventory.total_size,
+        'files': len(inventory.files),
+        'mb_per_s': inventory.total_size / MB / seconds if seconds else 0.0,
+        'files_per_s': len(inventory.files) / seconds if seconds else 0.0,
+    }
+    for key in ('cpu_user', 'cpu_system', 'read_calls', 'write_calls', 'read_bytes', 'write_bytes'):
+        if before.get(key) is not None and after.get(key) is not None:
+            result[key] = after[key] - before[key]
+    result['peak_rss'] = after.get('peak_rss')
+
+    print(json.dumps(result))
+
+
+def _usage():
+    times = os.times()
+    usage = {'cpu_user': times.user, 'cpu_system': times.system, 'peak_rss': None}
+
+    if sys.platform == 'win32':
+        usage.update(_windows_usage())
+        return usage
+
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['peak_rss'] = peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+    except ImportError:
+        pass
+
+    try:
+        with open('/proc/self/io') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+        usage.update({
+            'read_calls': int(io['syscr']), 'write_calls': int(io['syscw']),
+            'read_bytes': int(io['rchar']), 'write_bytes': int(io['wchar'])
+        })
+    except (OSError, KeyError, ValueError):
+        pass
+
+    return usage
+
+
+def _windows_usage():
+    import ctypes
+    from ctypes import wintypes
+
+    class IoCounters(ctypes.Structure):
+        _fields_ = [(name, ctypes.c_ulonglong) for name in (
+            'ReadOperationCount', 'WriteOperationCount', 'OtherOperationCount',
+            'ReadTransferCount', 'WriteTransferCount', 'OtherTransferCount'
+        )]
+
+    class MemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage'
+            )
+        ]
+
+    usage = {}
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+
+    io = IoCounters()
+    if ctypes.windll.kernel32.GetProcessIoCounters(process, ctypes.byref(io)):
+        usage.update({
+            'read_calls': io.ReadOperationCount, 'write_calls': io.WriteOperationCount,
+            'read_bytes': io.ReadTransferCount, 'write_bytes': io.WriteTransferCount
+        })
+
+    memory = MemoryCounters()
+    memory.cb = ctypes.sizeof(memory)
+    if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(memory), memory.cb):
+        usage['peak_rss'] = memory.PeakWorkingSetSize
+
+    return usage
+
+
+def summarize(results):
+    """
+    Median of each metric per profile, phase, backend and verify mode.
+    """
+    groups = {}
+    for result in results:
+        if result.get('ok'):
+            key = (result['profile'], result['phase'], result['backend'], result['verify'])
+            groups.setdefault(key, []).append(result)
+
+    summary = []
+    for (profile, phase, backend, verify), group in sorted(groups.items()):
+        row = {'profile': profile, 'phase': phase, 'backend': backend, 'verify': verify, 'runs': len(group)}
+        for metric in ('seconds', 'mb_per_s', 'files_per_s', 'cpu_user', 'cpu_system', 'read_calls', 'write_calls',
+                       'peak_rss'):
+            values = [result[metric] for result in group if result.get(metric) is not None]
+            row[metric] = statistics.median(values) if values else None
+        summary.append(row)
+
+    return summary
+
+
+def log_summary(summary, baseline=None):
+    baseline = {
+        (row['profile'], row['phase'], row['backend'], row['verify']): row for row in (baseline or [])
+    }
+
+    logger.info(f"{'Profile':<10} {'Phase':<7} {'Backend':<16} {'Verify':<9} {'MB/s':>9} {'Files/s':>10} "
+                f"{'CPU s':>7} {'Calls':>9} {'RSS MB':>7} {'vs base':>8}")
+    for row in summary:
+        calls = (row['read_calls'] or 0) + (row['write_calls'] or 0)
+        rss = (row['peak_rss'] or 0) / MB
+        cpu = (row['cpu_user'] or 0) + (row['cpu_system'] or 0)
+        base = baseline.get((row['profile'], row['phase'], row['backend'], row['verify']))
+        ratio = f"{row['mb_per_s'] / base['mb_per_s']:.2f}x" if base and base['mb_per_s'] else '-'
+        logger.info(
+            f"{row['profile']:<10} {row['phase']:<7} {row['backend']:<16} {row['verify']:<9} "
+            f"{row['mb_per_s']:>9.1f} {row['files_per_s']:>10.0f} {cpu:>7.2f} {calls:>9.0f} {rss:>7.1f} {ratio:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the copy and verify paths over synthetic game trees.")
+    parser.add_argument("--profiles", default=','.join(PROFILES), help=f"Comma separated profiles: {PROFILES}.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the file counts and large sizes.")
+    parser.add_argument("--seed", type=int, default=BENCH_SEED, help="Seed of the synthetic trees.")
+    parser.add_argument(
+        "--backends", default='auto', help=f"Comma separated copy backends, from auto and {available_backends()}."
+    )
+    parser.add_argument(
+        "--verify", default='stat',
+        help=f"Comma separated verify modes to time on their own, from {VERIFY_ONLY_MODES}."
+    )
+    parser.add_argument("--workers", type=int, default=int(os.getenv('COPY_WORKERS', '8')), help="Copy workers.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each trial.")
+    parser.add_argument(
+        "--set", action='append', default=[], metavar='KEY=VALUE', help="Setting applied to every trial."
+    )
+    parser.add_argument("--cold", action='store_true', help="Evict the trees from the page cache before each run.")
+    parser.add_argument("--dir", default=BENCH_DIR, help="Directory holding the trees and copies.")
+    parser.add_argument("--target-dir", help="Directory to copy into, e.g. on another disk (defaults to --dir).")
+    parser.add_argument("--output", help="JSON results file (defaults to a timestamped file in --dir).")
+    parser.add_argument("--compare", help="Earlier JSON results file to compare throughput against.")
+    parser.add_argument("--trial", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.trial:
+        _trial_main(json.loads(args.trial))
+        return
+
+    setup_logger('bench_log')
+    logger.info("=== Copy Benchmark Started ===")
+
+    settings = dict(setting.split('=', 1) for setting in args.set)
+    target_root = os.path.join(args.target_dir or args.dir, 'copies')
+    results = []
+
+    for profile in args.profiles.split(','):
+        if profile not in PROFILES:
+            logger.warning(f"Unknown profile '{profile}', skipping")
+            continue
+
+        source, spec = prepare_tree(profile, args.scale, args.seed, args.dir)
+        target = os.path.join(target_root, os.path.basename(source))
+
+        trials = [('copy', backend, 'none') for backend in args.backends.split(',')]
+        trials += [('verify', 'auto', mode) for mode in args.verify.split(',') if mode in VERIFY_ONLY_MODES]
+
+        for phase, backend, verify in trials:
+            for run in range(1, args.repeat + 1):
+                if phase == 'copy' and os.path.exists(target):
+                    shutil.rmtree(target)
+                if phase == 'verify' and not os.path.exists(target):
+                    logger.warning(f"No copy of '{source}' to verify, skipping")
+                    break
+                if args.cold:
+                    drop_cache(source)
+                    if phase == 'verify':
+                        drop_cache(target)
+
+                trial = {
+                    'phase': phase, 'source': source, 'target': target, 'workers': args.workers, 'verify': verify,
+                    'state': os.path.join(args.dir, 'state')
+                }
+                result = run_trial(trial, dict(settings, COPY_BACKEND=backend))
+                if result is None:
+                    continue
+
+                result.update({'profile': profile, 'phase': phase, 'backend': backend, 'verify': verify, 'run': run})
+                results.append(result)
+                logger.info(
+                    f"{profile} {phase} backend={backend} verify={verify} run {run}/{args.repeat}: "
+                    f"{result['mb_per_s']:.1f} MB/s, {result['files_per_s']:.0f} files/s"
+                    f"{'' if result['ok'] else ' (FAILED)'}"
+                )
+
+        if os.path.exists(target):
+            shutil.rmtree(target)
+
+    try:
+        os.rmdir(target_root)
+    except OSError:
+        pass
+
+    summary = summarize(results)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('summary')
+
+    log_summary(summary, baseline)
+
+    output = args.output or os.path.join(args.dir, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'platform': {
+                'system': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+                'backends': available_backends()
+            },
+            'arguments': {key: value for key, value in vars(args).items() if key != 'trial'},
+            'results': results,
+            'summary': summary
+        }, f, indent=4)
+
+    logger.info(f"Results written to {output}")
+    logger.info("=== Copy Benchmark Finished ===")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import logging
+import os
+import struct
+import zlib
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEGENDARY_MANIFEST_PATH = os.getenv('LEGENDARY_MANIFEST_PATH')
+LIBRARY_SOURCE = os.getenv('LIBRARY_SOURCE', 'legendary')
+
+MANIFEST_HEADER_MAGIC = 0x44BEC00C
+MANIFEST_STORED_COMPRESSED = 0x1
+
+logger = logging.getLogger(__name__)
+
+
+def get_manifest_files(game):
+    """
+    Get the files Epic expects in the game's install directory, from the EGS or Legendary binary manifest.
+
+    Returns a dict of normalised relative path to (size, sha1 hex or None), or None if unavailable.
+    """
+    egs_manifest_path = _find_egs_manifest(game)
+    legendary_manifest_path = None
+    if LEGENDARY_MANIFEST_PATH:
+        legendary_manifest_path = os.path.join(
+            os.path.dirname(LEGENDARY_MANIFEST_PATH), 'manifests', f"{game.app_name}.manifest"
+        )
+
+    manifest_paths = [egs_manifest_path, legendary_manifest_path]
+    if LIBRARY_SOURCE != 'egs':
+        manifest_paths.reverse()
+
+    for manifest_path in manifest_paths:
+        if not manifest_path or not os.path.exists(manifest_path):
+            continue
+
+        try:
+            files = _read_binary_manifest(manifest_path)
+        except Exception as e:
+            logger.error(f"Failed to read manifest {manifest_path}: {e}")
+            continue
+
+        logger.info(f"Loaded {len(files)} files from manifest {manifest_path} for game '{game.name}'")
+        return files
+
+    logger.warning(f"No file manifest found for game '{game.name}'")
+    return None
+
+
+def _find_egs_manifest(game):
+    egstore_dir = os.path.join(game.install_dir, '.egstore')
+    manifest_path = os.path.join(egstore_dir, f"{game.game_id}.manifest")
+    if os.path.exists(manifest_path):
+        return manifest_path
+
+    if os.path.isdir(egstore_dir):
+        manifest_files = [f for f in os.listdir(egstore_dir) if f.endswith('.manifest')]
+        if len(manifest_files) == 1:
+            return os.path.join(egstore_dir, manifest_files[0])
+
+    return None
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values[0] if len(values) == 1 else values
+
+    def read_bytes(self, length):
+        value = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return value
+
+    def read_fstring(self):
+        length = self.read('<i')
+        if length < 0:
+            return self.read_bytes(-length * 2).decode('utf-16-le').rstrip('\0')
+        return self.read_bytes(length).decode('ascii', errors='replace').rstrip('\0')
+
+
+def _read_binary_manifest(manifest_path):
+    with open(manifest_path, 'rb') as f:
+        data = f.read()
+
+    header = _Reader(data)
+    if header.read('<I') != MANIFEST_HEADER_MAGIC:
+        raise ValueError("Not a binary Epic manifest")
+
+    header_size = header.read('<I')
+    _, size_compressed = header.read('<II')
+    header.read_bytes(20)
+    stored_as = header.read('<B')
+
+    body = data[header_size:header_size + size_compressed]
+    if stored_as & MANIFEST_STORED_COMPRESSED:
+        body = zlib.decompress(body)
+
+    reader = _Reader(body)
+
+    meta_size = reader.read('<I')
+    reader.offset = meta_size
+
+    chunk_list_start = reader.offset
+    reader.offset = chunk_list_start + reader.read('<I')
+
+    reader.read('<I')
+    version = reader.read('<B')
+    count = reader.read('<I')
+
+    filenames = [reader.read_fstring() for _ in range(count)]
+    symlink_targets = [reader.read_fstring() for _ in range(count)]
+    hashes = [reader.read_bytes(20) for _ in range(count)]
+    reader.read_bytes(count)
+
+    for _ in range(count):
+        for _ in range(reader.read('<I')):
+            reader.read_fstring()
+
+    sizes = []
+    for _ in range(count):
+        size = 0
+        for _ in range(reader.read('<I')):
+            chunk_part_start = reader.offset
+            chunk_part_size = reader.read('<I')
+            reader.read_bytes(16)
+            _, part_size = reader.read('<II')
+            size += part_size
+            reader.offset = chunk_part_start + chunk_part_size
+        sizes.append(size)
+
+    logger.debug(f"Read {count} files from manifest {manifest_path} (file list version {version})")
+
+    files = {}
+    for filename, symlink_target, sha_hash, size in zip(filenames, symlink_targets, hashes, sizes):
+        if symlink_target:
+            continue
+
+        path = os.path.normcase(filename.replace('\\', os.sep).replace('/', os.sep))
+        files[path] = (size, sha_hash.hex() if any(sha_hash) else None)
+
+    return files
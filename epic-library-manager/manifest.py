@@ -1,5 +1,6 @@
 import logging
 import os
+import threading
 
 from dotenv import load_dotenv
 
@@ -15,19 +16,24 @@ UPDATE_LEGENDARY_MANIFEST = os.getenv('UPDATE_LEGENDARY_MANIFEST', 'False').lowe
 
 logger = logging.getLogger(__name__)
 
+_manifest_lock = threading.Lock()
+
 
 def update_manifest(game):
     """
     Update manifest files with the new game location.
+
+    The launcher files list every game, so updates from games moved at once are made one at a time.
     """
     success = True
 
-    if UPDATE_EGS_MANIFEST:
-        success &= _update_egl_manifest(game)
-        success &= _update_egl_launcher_data(game)
+    with _manifest_lock:
+        if UPDATE_EGS_MANIFEST:
+            success &= _update_egl_manifest(game)
+            success &= _update_egl_launcher_data(game)
 
-    if UPDATE_LEGENDARY_MANIFEST:
-        success &= _update_legendary_manifest(game)
+        if UPDATE_LEGENDARY_MANIFEST:
+            success &= _update_legendary_manifest(game)
 
     return success
 
@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from devices import describe_device, get_device, get_throughput
+from inventory import TreeInventory
+from utils import VERIFY_MODE, get_free_space, get_volume, is_same_volume
+
+load_dotenv()
+
+PLAN_HDD_MBPS = float(os.getenv('PLAN_HDD_MBPS', '120'))
+PLAN_SSD_MBPS = float(os.getenv('PLAN_SSD_MBPS', '400'))
+PLAN_DEVICE_MBPS = os.getenv('PLAN_DEVICE_MBPS', '')
+PLAN_FILE_MS = float(os.getenv('PLAN_FILE_MS', '0.5'))
+PLAN_FREE_SPACE_RESERVE = int(float(os.getenv('PLAN_FREE_SPACE_RESERVE_GB', '1')) * 1024 ** 3)
+PLAN_SCAN_WORKERS = int(os.getenv('PLAN_SCAN_WORKERS', '8'))
+
+PLAN_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def build_plan(launcher, moves, get_target_dir, get_manifest_files=None, verify_mode=None, scan=False, sizes=None):
+    """
+    Plan moving each (game, target_base_dir) pair: sizes, free space, expected duration and a feasible order.
+
+    Durations use the throughput measured by earlier copies between the same disks, or the configured throughput
+    of the slower disk plus a cost per file. Only games that need copying are measured: from the launcher's file
+    list when get_manifest_files has one, so large libraries are planned without walking every install, and from a
+    scan of the install directory otherwise or when scan is set. Games found in sizes, a dict of game_id to
+    (size, files), are not measured again.
+    """
+    verify_mode = (verify_mode or VERIFY_MODE).lower()
+    configured = _configured_device_mbps()
+
+    def plan_move(move):
+        game, target_base_dir = move
+        target_dir = get_target_dir(game, target_base_dir)
+        planned = {
+            'game_id': game.game_id,
+            'name': game.name,
+            'source_dir': game.install_dir,
+            'target_base_dir': target_base_dir,
+            'target_dir': target_dir,
+            'source_volume': get_volume(game.install_dir),
+            'target_volume': get_volume(target_base_dir),
+        }
+
+        if os.path.normcase(os.path.abspath(target_dir)) == os.path.normcase(os.path.abspath(game.install_dir)):
+            planned.update({'method': 'skip', 'size': 0, 'files': 0, 'seconds': 0.0})
+            return planned
+
+        if not os.path.exists(target_dir) and is_same_volume(game.install_dir, target_base_dir):
+            planned.update({'method': 'rename', 'size': 0, 'files': 0, 'seconds': 0.0})
+            return planned
+
+        if sizes and game.game_id in sizes:
+            size, files = sizes[game.game_id]
+        else:
+            size, files = measure_game(game, get_manifest_files, scan)
+        planned.update({'size': size, 'files': files})
+
+        source_device, target_device = get_device(game.install_dir), get_device(target_base_dir)
+        throughput = get_throughput(source_device, target_device)
+        measured = throughput is not None
+        if not measured:
+            mbps = min(_device_mbps(source_device, configured), _device_mbps(target_device, configured))
+            throughput = mbps * 1024 ** 2
+
+        seconds = size / throughput
+        if not measured:
+            seconds += files * PLAN_FILE_MS / 1000
+        if verify_mode in ('full', 'manifest'):
+            seconds += size / throughput
+
+        planned.update({
+            'method': 'copy',
+            'source_device': describe_device(source_device),
+            'target_device': describe_device(target_device),
+            'mbps': throughput / 1024 ** 2,
+            'throughput_source': 'measured' if measured else 'configured',
+            'seconds': seconds,
+        })
+        return planned
+
+    with ThreadPoolExecutor(max_workers=max(1, PLAN_SCAN_WORKERS)) as executor:
+        planned_moves = list(executor.map(plan_move, moves))
+
+    volumes = {}
+    for planned in planned_moves:
+        for key in ('source', 'target'):
+            volume = planned[f"{key}_volume"]
+            if volume not in volumes:
+                path = planned['source_dir'] if key == 'source' else planned['target_base_dir']
+                volumes[volume] = {'path': path, 'free': get_free_space(path) or 0}
+
+    ordered, unfit = _order_moves(planned_moves, {volume: info['free'] for volume, info in volumes.items()})
+    for order, planned in enumerate(ordered, start=1):
+        planned['order'] = order
+        planned['fits'] = True
+    for planned in unfit:
+        planned['order'] = None
+        planned['fits'] = False
+
+    copies = [planned for planned in ordered if planned['method'] == 'copy']
+    return {
+        'version': PLAN_VERSION,
+        'launcher': launcher,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'verify_mode': verify_mode,
+        'volumes': [dict(info, volume=volume) for volume, info in volumes.items()],
+        'moves': ordered + unfit,
+        'total_size': sum(planned['size'] for planned in copies),
+        'total_files': sum(planned['files'] for planned in copies),
+        'total_seconds': sum(planned['seconds'] for planned in ordered),
+        'feasible': not unfit,
+    }
+
+
+def log_plan(plan):
+    """
+    Log a plan as a table, in execution order, followed by its volumes and totals.
+    """
+    logger.info(f"{'#':>4} {'Method':<7} {'Size GB':>9} {'Files':>9} {'MB/s':>7} {'Time':>9}  Game -> Target")
+    for planned in plan['moves']:
+        order = planned['order'] if planned['fits'] else '-'
+        mbps = f"{planned['mbps']:.0f}" if 'mbps' in planned else '-'
+        method = planned['method'] if planned['fits'] else 'NO FIT'
+        logger.info(
+            f"{order:>4} {method:<7} {planned['size'] / 1024 ** 3:>9.2f} {planned['files']:>9} {mbps:>7} "
+            f"{_format_seconds(planned['seconds']):>9}  {planned['name']} -> {planned['target_dir']}"
+        )
+
+    for volume in plan['volumes']:
+        logger.info(f"Volume of '{volume['path']}': {volume['free'] / 1024 ** 3:.2f} GB free")
+
+    logger.info(
+        f"Plan: {len(plan['moves'])} games, {plan['total_size'] / 1024 ** 3:.2f} GB in {plan['total_files']} files "
+        f"to copy, expected to take {_format_seconds(plan['total_seconds'])} one game at a time"
+    )
+    if not plan['feasible']:
+        logger.warning("Some games do not fit in the free space of their target volume and are left out of the order")
+
+
+def save_plan(plan, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=4)
+    logger.info(f"Plan saved to {path}")
+
+
+def load_plan(path, launcher):
+    """
+    Read a saved plan, refusing plans made for another launcher or by an incompatible version.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+
+    if plan.get('version') != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan version {plan.get('version')} in {path}")
+    if plan.get('launcher') != launcher:
+        raise ValueError(f"Plan {path} was made for '{plan.get('launcher')}', not '{launcher}'")
+
+    return plan
+
+
+def measure_game(game, get_manifest_files=None, scan=False):
+    """
+    Get the size and file count of a game, from the launcher's file list unless scan is set or it has none.
+    """
+    if not scan and get_manifest_files:
+        try:
+            files = get_manifest_files(game)
+        except Exception as e:
+            logger.warning(f"Failed to read the file list of '{game.name}': {e}")
+            files = None
+        if files:
+            return sum(size for size, _ in files.values()), len(files)
+
+    inventory = TreeInventory.scan(game.install_dir)
+    return inventory.total_size, len(inventory.files)
+
+
+def _order_moves(planned_moves, free):
+    """
+    Order moves so that each copy fits in the free space its target volume has at that point, counting the space
+    given back by copies out of a volume. Copies moving data off a volume other copies are waiting for go first.
+    """
+    pending = [planned for planned in planned_moves if planned['method'] != 'copy']
+    copies = [planned for planned in planned_moves if planned['method'] == 'copy']
+    ordered = sorted(pending, key=lambda planned: planned['name'].lower())
+
+    while copies:
+        fits = [
+            planned for planned in copies
+            if planned['size'] + PLAN_FREE_SPACE_RESERVE <= free[planned['target_volume']]
+        ]
+        if not fits:
+            break
+
+        waiting = {planned['target_volume'] for planned in copies if planned not in fits}
+        planned = max(fits, key=lambda planned: (planned['source_volume'] in waiting, planned['size']))
+        copies.remove(planned)
+        ordered.append(planned)
+        free[planned['target_volume']] -= planned['size']
+        free[planned['source_volume']] += planned['size']
+
+    return ordered, copies
+
+
+def get_device_mbps(device):
+    """
+    Get the throughput in MB/s assumed for a disk, from PLAN_DEVICE_MBPS or its type.
+    """
+    return _device_mbps(device, _configured_device_mbps())
+
+
+def _configured_device_mbps():
+    configured = {}
+    for item in filter(None, (item.strip() for item in PLAN_DEVICE_MBPS.split(','))):
+        name, _, mbps = item.partition('=')
+        try:
+            configured[name.strip()] = float(mbps)
+        except ValueError:
+            logger.warning(f"Ignoring PLAN_DEVICE_MBPS entry '{item}'")
+    return configured
+
+
+def _device_mbps(device, configured):
+    if device.name in configured:
+        return configured[device.name]
+    return PLAN_HDD_MBPS if device.rotational in (True, None) else PLAN_SSD_MBPS
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
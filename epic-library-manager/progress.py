@@ -0,0 +1,309 @@
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from dotenv import load_dotenv
+from tqdm import tqdm
+
+load_dotenv()
+
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '0.5'))
+PROGRESS_RATE_WINDOW = float(os.getenv('PROGRESS_RATE_WINDOW', '10'))
+PROGRESS_JSON = os.getenv('PROGRESS_JSON')
+
+ProgressEvent = namedtuple(
+    'ProgressEvent',
+    [
+        'id', 'parent', 'kind', 'state', 'name', 'bytes_done', 'bytes_total', 'items_done', 'items_total', 'rate',
+        'average_rate', 'eta', 'elapsed', 'time'
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+_progress = None
+_progress_lock = threading.Lock()
+
+
+class ProgressTracker:
+    """
+    Bytes and items done for one file, game or batch of games, published to a progress bus.
+
+    Updates are coalesced, so an event is published at most once per PROGRESS_INTERVAL whatever the number of calls
+    to advance. Bytes are passed on to the parent tracker; items are not, each level counts its own.
+
+    The average rate is the overall rate for the first PROGRESS_RATE_WINDOW seconds, then an exponential moving
+    average over that window.
+    """
+
+    def __init__(self, bus, kind, name, bytes_total=None, items_total=0, bytes_done=0, items_done=0, parent=None):
+        self.bus = bus
+        self.id = next(bus.ids)
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.bytes_total = bytes_total
+        self.items_total = items_total
+        self.bytes_done = bytes_done
+        self.items_done = items_done
+        self.children = 0
+        self.rate = 0.0
+        self.average_rate = 0.0
+        self.started = None
+        self.state = None
+        self._published = None
+        self._published_bytes = bytes_done
+        self._started_bytes = bytes_done
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish(exc_type is None)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started is not None else 0.0
+
+    @property
+    def growing(self):
+        return self.kind == 'batch'
+
+    @property
+    def eta(self):
+        """
+        Seconds left at the moving-average rate. When the byte total grows as children start, the bytes of the
+        children not started yet are extrapolated from those that have.
+        """
+        if not self.average_rate or self.bytes_total is None:
+            return None
+
+        bytes_total = self.bytes_total
+        if self.growing and self.children and self.items_total > self.children:
+            bytes_total = bytes_total * self.items_total / self.children
+        return max(0.0, bytes_total - self.bytes_done) / self.average_rate
+
+    def child(self, kind, name, bytes_total, items_total=0, bytes_done=0, items_done=0):
+        """
+        Track part of this tracker's work. A batch grows by the byte total of each game started in it.
+        """
+        with self._lock:
+            self.children += 1
+            if self.growing:
+                self.bytes_total += bytes_total
+                self.bytes_done += bytes_done
+                self._published_bytes += bytes_done
+                self._started_bytes += bytes_done
+
+        return ProgressTracker(self.bus, kind, name, bytes_total, items_total, bytes_done, items_done, self)
+
+    def start(self):
+        with self._lock:
+            self.started = self._published = time.monotonic()
+            self.state = 'start'
+            event = self._event()
+        self.bus.publish(event)
+
+    def advance(self, bytes=0, items=0):
+        """
+        Record bytes and items done since the last call, publishing an update if one is due.
+        """
+        if self.parent is not None and bytes:
+            self.parent.advance(bytes)
+
+        with self._lock:
+            self.bytes_done += bytes
+            self.items_done += items
+
+            now = time.monotonic()
+            if self.state not in ('start', 'update') or now - self._published < PROGRESS_INTERVAL:
+                return
+            self._update_rates(now)
+            self.state = 'update'
+            event = self._event()
+
+        self.bus.publish(event)
+
+    def finish(self, succeeded=True):
+        """
+        Publish the final event, topping the bytes up to the total on success for backends that do not report
+        every chunk (clones, sparse holes).
+        """
+        if succeeded and self.bytes_total is not None and not self.growing:
+            self.advance(self.bytes_total - self.bytes_done)
+
+        with self._lock:
+            self._update_rates(time.monotonic())
+            self.state = 'finish' if succeeded else 'fail'
+            event = self._event()
+
+        self.bus.publish(event)
+
+    def _update_rates(self, now):
+        interval = now - self._published
+        if interval <= 0:
+            return
+
+        self.rate = (self.bytes_done - self._published_bytes) / interval
+        if now - self.started < PROGRESS_RATE_WINDOW:
+            self.average_rate = (self.bytes_done - self._started_bytes) / (now - self.started)
+        else:
+            weight = 1 - math.exp(-interval / PROGRESS_RATE_WINDOW)
+            self.average_rate += weight * (self.rate - self.average_rate)
+
+        self._published = now
+        self._published_bytes = self.bytes_done
+
+    def _event(self):
+        return ProgressEvent(
+            self.id, self.parent.id if self.parent else None, self.kind, self.state, self.name, self.bytes_done,
+            self.bytes_total, self.items_done, self.items_total, self.rate, self.average_rate, self.eta,
+            self.elapsed, time.time()
+        )
+
+
+class ProgressBus:
+    """
+    Deliver progress events from every copy in the process to the subscribed callables.
+
+    A batch started with batch() becomes the parent of the games tracked while it is open.
+    """
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.subscribers = []
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, event):
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber(event)
+            except Exception as e:
+                logger.warning(f"Progress subscriber {subscriber} failed, unsubscribing it: {e}")
+                self.unsubscribe(subscriber)
+
+    def batch(self, name, games):
+        """
+        Track a batch of games as a context manager. Each game still has to be counted with advance(items=1).
+        """
+        return _BatchContext(self, ProgressTracker(self, 'batch', name, 0, games))
+
+    def game(self, name, bytes_total, files_total, bytes_done=0, files_done=0):
+        """
+        Track the copy of one game, inside the innermost open batch if there is one.
+        """
+        if self.batches:
+            return self.batches[-1].child('game', name, bytes_total, files_total, bytes_done, files_done)
+        return ProgressTracker(self, 'game', name, bytes_total, files_total, bytes_done, files_done)
+
+
+class _BatchContext:
+    def __init__(self, bus, tracker):
+        self.bus = bus
+        self.tracker = tracker
+
+    def __enter__(self):
+        self.bus.batches.append(self.tracker)
+        self.tracker.start()
+        return self.tracker
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.bus.batches.remove(self.tracker)
+        self.tracker.finish(exc_type is None)
+
+
+class TqdmSubscriber:
+    """
+    Show a tqdm bar for each batch and game, with the moving-average rate and ETA from the events.
+    """
+
+    def __init__(self):
+        self.bars = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.kind == 'file':
+            return
+
+        with self._lock:
+            if event.state == 'start':
+                self.bars[event.id] = tqdm(
+                    total=event.bytes_total or None, initial=event.bytes_done, unit='B', unit_scale=True,
+                    desc=event.name, position=len(self.bars), leave=event.kind == 'game' or not self.bars
+                )
+                return
+
+            bar = self.bars.get(event.id)
+            if bar is None:
+                return
+
+            if event.bytes_total:
+                bar.total = event.bytes_total
+            bar.n = event.bytes_done
+
+            postfix = f"{event.items_done}/{event.items_total} {'games' if event.kind == 'batch' else 'files'}"
+            if event.average_rate:
+                postfix += f", avg {event.average_rate / (1024 ** 2):.1f} MB/s"
+            if event.eta is not None:
+                postfix += f", ETA {tqdm.format_interval(event.eta)}"
+            bar.set_postfix_str(postfix, refresh=False)
+            bar.refresh()
+
+            if event.state in ('finish', 'fail'):
+                bar.close()
+                del self.bars[event.id]
+
+
+class JsonLinesSubscriber:
+    """
+    Write every event as a JSON object on its own line, to a file or to stdout for '-'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = sys.stdout if path == '-' else open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event._asdict())
+        with self._lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def get_progress():
+    """
+    Return the progress bus shared by every copy in this process, with a tqdm subscriber and, when PROGRESS_JSON
+    is set, a JSON-lines subscriber writing to it.
+    """
+    global _progress
+    with _progress_lock:
+        if _progress is None:
+            _progress = ProgressBus()
+            _progress.subscribe(TqdmSubscriber())
+            if PROGRESS_JSON:
+                _progress.subscribe(JsonLinesSubscriber(PROGRESS_JSON))
+        return _progress
@@ -0,0 +1,210 @@
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MOVE_MAX_MBPS = float(os.getenv('MOVE_MAX_MBPS', '0'))
+MOVE_LOW_PRIORITY = os.getenv('MOVE_LOW_PRIORITY', 'False').lower() == "true"
+THROTTLE_CONTROL_FILE = (
+    os.getenv('THROTTLE_CONTROL_FILE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'throttle.txt')
+)
+THROTTLE_CHECK_INTERVAL = 1.0
+THROTTLE_MIN_CHUNK_SIZE = 64 * 1024
+
+PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'aarch64': 30, 'i386': 289, 'i686': 289, 'armv7l': 314}
+
+logger = logging.getLogger(__name__)
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every copy thread, holding at most one second of bandwidth.
+
+    The limit is re-read from the control file whenever it changes, so a running move can be slowed down or sped up.
+    A control file left over from an earlier run is ignored until it is written again.
+    """
+
+    def __init__(self, max_mbps=0.0, control_file=None):
+        self.control_file = control_file
+        self.rate = 0.0
+        self.tokens = 0.0
+        self._control_mtime = self._control_file_mtime()
+        self._last_check = 0.0
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        if max_mbps:
+            self.set_max_mbps(max_mbps)
+
+    @property
+    def max_mbps(self):
+        return self.rate / (1024 ** 2)
+
+    def set_max_mbps(self, max_mbps):
+        with self._lock:
+            self.rate = max(0.0, float(max_mbps or 0)) * 1024 ** 2
+            self.tokens = min(self.tokens, self.rate)
+
+        if self.rate:
+            logger.info(f"Copy bandwidth limited to {self.max_mbps:.1f} MB/s")
+        else:
+            logger.info("Copy bandwidth unlimited")
+
+    def chunk_size(self, chunk_size):
+        """
+        Shrink chunk_size so one chunk never holds more than a fraction of a second's budget.
+        """
+        self._check_control_file()
+        if not self.rate:
+            return chunk_size
+        return max(THROTTLE_MIN_CHUNK_SIZE, min(chunk_size, int(self.rate / 8)))
+
+    def consume(self, size):
+        """
+        Take size bytes from the bucket, sleeping until the limit allows them.
+        """
+        self._check_control_file()
+
+        with self._lock:
+            if not self.rate:
+                return
+
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self.tokens -= size
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if delay:
+            time.sleep(delay)
+
+    def refund(self, size):
+        """
+        Give back size bytes taken for data that has to be copied again.
+        """
+        with self._lock:
+            if self.rate:
+                self.tokens = min(self.rate, self.tokens + size)
+
+    def _check_control_file(self):
+        if not self.control_file:
+            return
+
+        now = time.monotonic()
+        if now - self._last_check < THROTTLE_CHECK_INTERVAL:
+            return
+        self._last_check = now
+
+        mtime = self._control_file_mtime()
+        if mtime is None or mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+
+        try:
+            with open(self.control_file, 'r', encoding='utf-8') as f:
+                max_mbps = float(f.read().strip() or 0)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring throttle control file '{self.control_file}': {e}")
+            return
+
+        if max_mbps != self.max_mbps:
+            logger.info(f"Throttle control file '{self.control_file}' changed")
+            self.set_max_mbps(max_mbps)
+
+    def _control_file_mtime(self):
+        if not self.control_file:
+            return None
+
+        try:
+            return os.stat(self.control_file).st_mtime_ns
+        except OSError:
+            return None
+
+
+def get_rate_limiter():
+    """
+    Return the rate limiter shared by every copy in this process, created from MOVE_MAX_MBPS on first use.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(MOVE_MAX_MBPS, THROTTLE_CONTROL_FILE)
+        return _rate_limiter
+
+
+def set_low_priority():
+    """
+    Lower the CPU and I/O priority of this process.
+
+    On Linux both priorities belong to threads: every thread already running is lowered, and threads started later,
+    like the copy workers, inherit the priorities of the thread starting them. The idle I/O class only takes effect
+    with an I/O scheduler that honours it, such as BFQ.
+    """
+    if sys.platform == 'win32':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        if not kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN):
+            logger.warning(f"Failed to lower process priority: {ctypes.WinError()}")
+            return False
+
+        logger.info("Running with background CPU and I/O priority")
+        return True
+
+    lowered = True
+    try:
+        if sys.platform.startswith('linux'):
+            for tid in _thread_ids():
+                os.setpriority(os.PRIO_PROCESS, tid, 19)
+        else:
+            os.nice(19)
+    except OSError as e:
+        logger.warning(f"Failed to lower CPU priority: {e}")
+        lowered = False
+
+    if sys.platform.startswith('linux'):
+        try:
+            for tid in _thread_ids():
+                _set_io_priority(tid, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT)
+        except OSError as e:
+            logger.warning(f"Failed to set the idle I/O class, moves will compete with games for disk time: {e}")
+            lowered = False
+    else:
+        logger.warning("The I/O priority can only be lowered on Linux and Windows, only the CPU priority was lowered")
+        lowered = False
+
+    if lowered:
+        logger.info("Running with idle CPU and I/O priority")
+    return lowered
+
+
+def _thread_ids():
+    try:
+        return [int(tid) for tid in os.listdir('/proc/self/task')]
+    except OSError:
+        return [threading.get_native_id()]
+
+
+def _set_io_priority(tid, priority):
+    number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if number is None:
+        raise OSError(f"ioprio_set is not known on {platform.machine()}")
+
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(number, IOPRIO_WHO_PROCESS, tid, priority) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
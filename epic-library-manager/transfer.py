@@ -0,0 +1,608 @@
+import errno
+import logging
+import mmap
+import os
+import queue
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from hashing import format_digest, new_hasher, resolve_algorithm
+from throttle import get_rate_limiter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+load_dotenv()
+
+COPY_BACKEND = os.getenv('COPY_BACKEND', 'auto').lower()
+COPY_CHUNK_SIZE = int(os.getenv('COPY_CHUNK_MB', '16')) * 1024 * 1024
+COPY_PREALLOCATE_SIZE = int(os.getenv('COPY_PREALLOCATE_MB', '64')) * 1024 * 1024
+COPY_DROP_CACHE = os.getenv('COPY_DROP_CACHE', 'True').lower() == "true"
+COPY_DIRECT_IO = os.getenv('COPY_DIRECT_IO', 'False').lower() == "true"
+COPY_PIPELINE_BUFFERS = int(os.getenv('COPY_PIPELINE_BUFFERS', '3'))
+COPY_RANGE_WORKERS = int(os.getenv('COPY_RANGE_WORKERS', '4'))
+
+FALLBACK_ERRNOS = {
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTSOCK, errno.ENOTTY
+}
+
+HASHING_BACKENDS = {'reflink', 'direct', 'pipelined', 'sparse', 'buffered'}
+STREAMING_BACKENDS = {'copy_file_range', 'sendfile', 'pipelined', 'sparse', 'buffered'}
+RANGED_BACKENDS = {'ranges'}
+
+DIRECT_IO_ALIGNMENT = 4096
+
+FICLONE = 0x40049409
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_FLAG_SYNC = 0x1
+
+logger = logging.getLogger(__name__)
+
+
+def _reflink(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+    # Whole-file FICLONE only, so reflink is Linux-only (btrfs, XFS with reflink). Partial clones with FICLONERANGE and
+    # ReFS block cloning on Windows are not supported.
+    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    return size
+
+
+def _copy_file_range(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(chunk_size, size - offset))
+        if copied == 0:
+            if offset == 0:
+                raise OSError(errno.ENOTSUP, "copy_file_range copied no data")
+            break
+        offset += copied
+
+        if on_chunk:
+            on_chunk(offset, copied)
+
+    return offset
+
+
+def _sendfile(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, min(chunk_size, size - offset))
+        if sent == 0:
+            if offset == 0:
+                raise OSError(errno.ENOTSUP, "sendfile copied no data")
+            break
+        offset += sent
+
+        if on_chunk:
+            on_chunk(offset, sent)
+
+    return offset
+
+
+def _direct(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+    chunk_size = max(DIRECT_IO_ALIGNMENT, chunk_size // DIRECT_IO_ALIGNMENT * DIRECT_IO_ALIGNMENT)
+    buffer_size = min(chunk_size, -(-max(1, size) // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT)
+    src_flags = fcntl.fcntl(fsrc.fileno(), fcntl.F_GETFL)
+    dst_flags = fcntl.fcntl(fdst.fileno(), fcntl.F_GETFL)
+
+    offset = 0
+    try:
+        fcntl.fcntl(fsrc.fileno(), fcntl.F_SETFL, src_flags | os.O_DIRECT)
+        fcntl.fcntl(fdst.fileno(), fcntl.F_SETFL, dst_flags | os.O_DIRECT)
+
+        with mmap.mmap(-1, buffer_size) as aligned, memoryview(aligned) as buffer:
+            while True:
+                read = fsrc.readinto(buffer)
+                if not read:
+                    break
+
+                if hasher:
+                    hasher.update(buffer[:read])
+
+                padded = -(-read // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT
+                written = 0
+                while written < padded:
+                    written += fdst.write(buffer[written:padded])
+                offset += read
+
+                if on_chunk:
+                    on_chunk(offset, read)
+
+        fdst.truncate(offset)
+    finally:
+        fcntl.fcntl(fsrc.fileno(), fcntl.F_SETFL, src_flags)
+        fcntl.fcntl(fdst.fileno(), fcntl.F_SETFL, dst_flags)
+
+    return offset
+
+
+def _buffered(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+    offset = 0
+    with memoryview(bytearray(max(1, min(chunk_size, size)))) as buffer:
+        while True:
+            read = fsrc.readinto(buffer)
+            if not read:
+                break
+
+            if hasher:
+                hasher.update(buffer[:read])
+
+            written = 0
+            while written < read:
+                written += fdst.write(buffer[written:read])
+            offset += read
+
+            if on_chunk:
+                on_chunk(offset, read)
+
+    return offset
+
+
+def _pipelined(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+    buffer_size = max(1, min(chunk_size, size))
+    free = queue.Queue()
+    filled = queue.Queue()
+    stop = threading.Event()
+    for _ in range(max(2, COPY_PIPELINE_BUFFERS)):
+        free.put(bytearray(buffer_size))
+
+    def read_ahead():
+        try:
+            while not stop.is_set():
+                buffer = free.get()
+                if buffer is None:
+                    return
+
+                read = fsrc.readinto(buffer)
+                filled.put((buffer, read))
+                if not read:
+                    return
+        except BaseException as e:
+            filled.put((None, e))
+
+    reader = threading.Thread(target=read_ahead, daemon=True)
+    reader.start()
+
+    offset = 0
+    try:
+        while True:
+            buffer, read = filled.get()
+            if buffer is None:
+                raise read
+            if not read:
+                break
+
+            with memoryview(buffer) as view:
+                if hasher:
+                    hasher.update(view[:read])
+
+                written = 0
+                while written < read:
+                    written += fdst.write(view[written:read])
+            offset += read
+
+            if on_chunk:
+                on_chunk(offset, read)
+
+            free.put(buffer)
+    finally:
+        stop.set()
+        free.put(None)
+        reader.join()
+
+    return offset
+
+
+def _ranges(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+    src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+    starts = range(0, size, chunk_size)
+
+    def copy_range(start):
+        offset, end = start, min(start + chunk_size, size)
+        while offset < end:
+            data = os.pread(src_fd, end - offset, offset)
+            if not data:
+                break
+
+            written = 0
+            while written < len(data):
+                written += os.pwrite(dst_fd, data[written:], offset + written)
+            offset += len(data)
+
+            if on_chunk:
+                on_chunk(offset, len(data))
+
+        return offset
+
+    # A range that ends early means the source shrank, so the copy ends at the first short range.
+    copied = 0
+    with ThreadPoolExecutor(max_workers=max(1, COPY_RANGE_WORKERS)) as executor:
+        for start, end in zip(starts, executor.map(copy_range, starts)):
+            copied = end
+            if end < min(start + chunk_size, size):
+                break
+
+    return copied
+
+
+def _sparse(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+    src_fd = fsrc.fileno()
+    offset = 0
+    with memoryview(bytearray(max(1, min(chunk_size, size)))) as buffer:
+        while offset < size:
+            try:
+                data = os.lseek(src_fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                data = size
+
+            hole = os.lseek(src_fd, data, os.SEEK_HOLE) if data < size else size
+
+            if hasher:
+                for zeros in range(offset, data, len(buffer)):
+                    hasher.update(bytes(min(len(buffer), data - zeros)))
+
+            fsrc.seek(data)
+            fdst.seek(data)
+            while data < hole:
+                read = fsrc.readinto(buffer[:min(len(buffer), hole - data)])
+                if not read:
+                    break
+
+                if hasher:
+                    hasher.update(buffer[:read])
+
+                written = 0
+                while written < read:
+                    written += fdst.write(buffer[written:read])
+                data += read
+
+                if on_chunk:
+                    on_chunk(data, read)
+
+            if data < hole:
+                offset = data
+                break
+            offset = hole
+
+    fdst.truncate(offset)
+    return offset
+
+
+BACKENDS = {
+    'reflink': _reflink,
+    'direct': _direct,
+    'copy_file_range': _copy_file_range,
+    'sendfile': _sendfile,
+    'pipelined': _pipelined,
+    'ranges': _ranges,
+    'sparse': _sparse,
+    'buffered': _buffered,
+}
+
+
+def available_backends():
+    """
+    List the copy backends supported by this platform, fastest first.
+    """
+    backends = []
+    if fcntl is not None and sys.platform.startswith('linux'):
+        backends.append('reflink')
+    if COPY_DIRECT_IO and fcntl is not None and hasattr(os, 'O_DIRECT'):
+        backends.append('direct')
+    if hasattr(os, 'copy_file_range'):
+        backends.append('copy_file_range')
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        backends.append('sendfile')
+    backends.append('buffered')
+    return backends
+
+
+class _CacheHints:
+    """
+    posix_fadvise hints for one file copy: read ahead of the source, and drop both files from the page cache behind
+    the copy so a large move does not evict everything else.
+
+    Streaming backends report how far they got with advance(); backends copying ranges out of order report each
+    finished range with drop().
+    """
+
+    def __init__(self, fsrc, fdst, chunk_size):
+        self.src_fd = fsrc.fileno()
+        self.dst_fd = fdst.fileno()
+        self.chunk_size = chunk_size
+        self.dropped = 0
+        self.written = 0
+        self.pending = []
+        self._lock = threading.Lock()
+
+        self._advise(self.src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        self._advise(self.src_fd, 0, chunk_size, os.POSIX_FADV_WILLNEED)
+
+    def advance(self, offset):
+        self._advise(self.src_fd, offset, self.chunk_size, os.POSIX_FADV_WILLNEED)
+        self._advise(self.src_fd, self.written, offset - self.written, os.POSIX_FADV_DONTNEED)
+
+        # Dirty pages are only dropped once written back, so each target range is advised twice: the first call
+        # starts writeback and the next one, a chunk later, evicts the now clean pages.
+        self._advise(self.dst_fd, self.dropped, offset - self.dropped, os.POSIX_FADV_DONTNEED)
+        self.dropped = self.written
+        self.written = offset
+
+    def drop(self, offset, length):
+        self._advise(self.src_fd, offset, length, os.POSIX_FADV_DONTNEED)
+        self._advise(self.dst_fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+        # As in advance(), target ranges are advised again once later ranges finish, by when they are written back.
+        with self._lock:
+            written, self.pending = self.pending, [(offset, length)]
+        for written_offset, written_length in written:
+            self._advise(self.dst_fd, written_offset, written_length, os.POSIX_FADV_DONTNEED)
+
+    def finish(self):
+        self._advise(self.src_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        self._advise(self.dst_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+    @staticmethod
+    def _advise(fd, offset, length, advice):
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+def _is_sparse(file_stat):
+    blocks = getattr(file_stat, 'st_blocks', None)
+    return hasattr(os, 'SEEK_DATA') and blocks is not None and blocks * 512 < file_stat.st_size
+
+
+def _allocated_size(file_stat, size):
+    blocks = getattr(file_stat, 'st_blocks', None)
+    return size if blocks is None else min(size, blocks * 512)
+
+
+def count_extents(path):
+    """
+    Count the extents a file occupies on disk with FIEMAP, or return None where that is not supported.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return None
+
+    fiemap = bytearray(struct.pack('=QQIIII', 0, 0xFFFFFFFFFFFFFFFF, FIEMAP_FLAG_SYNC, 0, 0, 0))
+    try:
+        with open(path, 'rb') as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, fiemap, True)
+    except OSError:
+        return None
+
+    return struct.unpack_from('=I', fiemap, 20)[0]
+
+
+class FileCopier:
+    """
+    Copy file contents with a chain of backends, falling back when a backend is refused.
+
+    With hash_files, data is hashed as it is read, which limits copies to backends that see the bytes.
+    """
+
+    def __init__(self, backend=None, chunk_size=None, hash_files=False, limiter=None, preallocate_size=None):
+        backend = (backend or COPY_BACKEND).lower()
+        available = available_backends()
+
+        self.auto = backend == 'auto'
+        if self.auto:
+            self.backends = available
+        elif backend in available:
+            self.backends = [backend] if backend == 'buffered' else [backend, 'buffered']
+        else:
+            logger.warning(f"Copy backend '{backend}' is not available on this platform, using: {available}")
+            self.backends = available
+
+        if hash_files:
+            self.backends = [name for name in self.backends if name in HASHING_BACKENDS] or ['buffered']
+
+        self.chunk_size = chunk_size or COPY_CHUNK_SIZE
+        self.limiter = limiter or get_rate_limiter()
+        self.preallocate_size = COPY_PREALLOCATE_SIZE if preallocate_size is None else preallocate_size
+        self.drop_cache = COPY_DROP_CACHE and hasattr(os, 'posix_fadvise')
+        self.hash_algorithm = resolve_algorithm() if hash_files else None
+        self.disabled = set()
+        self.cloned = set()
+        self.digests = {}
+        self.usage = defaultdict(lambda: [0, 0])
+        self.large_files = []
+        self.preallocated = 0
+        self.written_size = 0
+        self._lock = threading.Lock()
+
+    def copy(self, src, dst, chunk_size=None, prefer=None, on_progress=None):
+        """
+        Copy file data and metadata from src to dst, returning the content digest when hashing.
+
+        prefer names a large-file backend ('pipelined' or 'ranges') to try after reflink and direct I/O. Sparse
+        sources always prefer the 'sparse' backend, which copies only their data regions. on_progress is called
+        with the length of each chunk written, from the copying threads.
+        """
+        with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb', buffering=0) as fdst:
+            src_stat = os.fstat(fsrc.fileno())
+            size = src_stat.st_size
+            if _is_sparse(src_stat):
+                prefer = 'sparse'
+
+            chunk_size = self.limiter.chunk_size(chunk_size or self.chunk_size)
+            backend, digest = self._copy_data(fsrc, fdst, size, dst, chunk_size, prefer, on_progress)
+            written = 0 if backend == 'reflink' else _allocated_size(os.fstat(fdst.fileno()), size)
+
+        shutil.copystat(src, dst)
+
+        with self._lock:
+            self.usage[backend][0] += 1
+            self.usage[backend][1] += size
+            self.written_size += written
+            if backend == 'reflink':
+                self.cloned.add(dst)
+            if digest:
+                self.digests[dst] = digest
+            if self.preallocate_size and size >= self.preallocate_size and backend != 'reflink':
+                self.large_files.append(dst)
+
+        return digest
+
+    def link(self, existing, dst, size):
+        """
+        Recreate dst as a hardlink to the already copied existing file, returning the digest recorded for it.
+        """
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.link(existing, dst)
+
+        with self._lock:
+            self.usage['hardlink'][0] += 1
+            self.usage['hardlink'][1] += size
+            if existing in self.cloned:
+                self.cloned.add(dst)
+            digest = self.digests.get(existing)
+            if digest:
+                self.digests[dst] = digest
+
+        return digest
+
+    def probe(self, src, dst_dir):
+        """
+        Try cloning src into dst_dir once, disabling reflink for this copier if the filesystems refuse it.
+        """
+        if 'reflink' not in self.backends or 'reflink' in self.disabled:
+            return False
+
+        try:
+            with open(src, 'rb', buffering=0) as fsrc, tempfile.TemporaryFile(dir=dst_dir) as fdst:
+                _reflink(fsrc, fdst, 0, self.chunk_size)
+        except OSError as e:
+            self.disabled.add('reflink')
+            logger.info(f"Reflink cloning not supported from '{src}' to '{dst_dir}' ({e})")
+            return False
+
+        logger.info(f"Reflink cloning supported from '{src}' to '{dst_dir}'")
+        return True
+
+    def log_summary(self):
+        """
+        Log how many files and bytes each backend copied.
+        """
+        for backend, (files, size) in self.usage.items():
+            logger.info(f"Copy backend '{backend}': {files} files, {size / (1024 ** 3):.2f} GB")
+
+        logical_size = sum(size for _, size in self.usage.values())
+        logger.info(
+            f"Copied {logical_size / (1024 ** 3):.2f} GB of file data, wrote {self.written_size / (1024 ** 3):.2f} GB "
+            f"({max(0, logical_size - self.written_size) / (1024 ** 3):.2f} GB saved by reflinks, sparse files and "
+            f"hardlinks)"
+        )
+
+        if self.preallocated:
+            logger.info(f"Preallocated {self.preallocated} files of {self.preallocate_size // (1024 ** 2)} MB or more")
+
+        extents = [(count_extents(path), path) for path in self.large_files]
+        extents = [(count, path) for count, path in extents if count is not None]
+        if extents:
+            most, path = max(extents)
+            logger.info(
+                f"Large files: {len(extents)} files, {sum(count for count, _ in extents) / len(extents):.1f} "
+                f"extents on average, most fragmented '{path}' with {most} extents"
+            )
+
+    def _backend_chain(self, prefer):
+        if not self.auto or prefer not in BACKENDS or (self.hash_algorithm and prefer not in HASHING_BACKENDS):
+            return self.backends
+        if prefer == 'ranges' and not hasattr(os, 'pread'):
+            return self.backends
+
+        ahead = ('reflink',) if prefer == 'sparse' else ('reflink', 'direct')
+        leading = [backend for backend in self.backends if backend in ahead]
+        return leading + [prefer] + [backend for backend in self.backends if backend not in leading]
+
+    def _copy_data(self, fsrc, fdst, size, dst, chunk_size, prefer=None, on_progress=None):
+        for backend in self._backend_chain(prefer):
+            if backend in self.disabled:
+                continue
+
+            hasher = new_hasher(self.hash_algorithm) if self.hash_algorithm and backend != 'reflink' else None
+            hints = None
+            if self.drop_cache and (backend in STREAMING_BACKENDS or backend in RANGED_BACKENDS):
+                hints = _CacheHints(fsrc, fdst, chunk_size)
+
+            # Chunks may be reported from several threads; appending to a list is atomic, so it needs no lock.
+            reported = []
+
+            def on_chunk(offset, length):
+                reported.append(length)
+                self.limiter.consume(length)
+                if hints and backend in RANGED_BACKENDS:
+                    hints.drop(offset - length, length)
+                elif hints:
+                    hints.advance(offset)
+                if on_progress:
+                    on_progress(length)
+
+            try:
+                preallocated = backend not in ('reflink', 'sparse') and self._preallocate(fdst, size, dst)
+                copied = BACKENDS[backend](fsrc, fdst, size, chunk_size, hasher, on_chunk)
+                if hints:
+                    hints.finish()
+                if preallocated:
+                    if copied < size:
+                        fdst.truncate(copied)
+                    with self._lock:
+                        self.preallocated += 1
+                return backend, format_digest(self.hash_algorithm, hasher) if hasher else None
+
+            except OSError as e:
+                if backend == 'buffered' or e.errno not in FALLBACK_ERRNOS:
+                    raise
+
+                # A backend refusing a file outright will refuse the others too, while one failing partway through
+                # may only have hit something about this file, so it is only disabled in the first case.
+                done = sum(reported)
+                if done:
+                    logger.info(f"Copy backend '{backend}' failed partway through '{dst}' ({e}), falling back")
+                    self.limiter.refund(done)
+                    if on_progress:
+                        on_progress(-done)
+                else:
+                    with self._lock:
+                        if backend not in self.disabled:
+                            self.disabled.add(backend)
+                            logger.info(f"Copy backend '{backend}' refused for '{dst}' ({e}), falling back")
+
+                fsrc.seek(0)
+                fdst.truncate(0)
+                fdst.seek(0)
+
+        raise OSError(errno.ENOTSUP, f"No copy backend accepted '{dst}'")
+
+    def _preallocate(self, fdst, size, dst):
+        if not self.preallocate_size or size < self.preallocate_size or 'preallocate' in self.disabled:
+            return False
+
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fdst.fileno(), 0, size)
+            else:
+                fdst.truncate(size)
+        except OSError as e:
+            with self._lock:
+                if 'preallocate' not in self.disabled:
+                    self.disabled.add('preallocate')
+                    logger.info(f"Preallocation refused for '{dst}' ({e}), writing without it")
+            return False
+
+        return True
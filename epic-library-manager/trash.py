@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import queue
+import shutil
+import stat
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from inventory import TreeInventory
+
+load_dotenv()
+
+BACKGROUND_DELETE = os.getenv('BACKGROUND_DELETE', 'True').lower() == "true"
+DELETE_WORKERS = int(os.getenv('DELETE_WORKERS', '8'))
+TRASH_DIR_NAME = '.library-manager-trash'
+TRASH_QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trash.json')
+
+logger = logging.getLogger(__name__)
+
+_trash = None
+_trash_lock = threading.Lock()
+
+
+def remove_tree(dir, inventory=None, workers=DELETE_WORKERS):
+    """
+    Delete the files of a tree on a thread pool, then its directories deepest first.
+
+    Files reached through symlinked directories are left alone, only the links themselves are removed.
+    """
+    inventory = inventory or TreeInventory.scan(dir, workers)
+
+    def remove_file(entry):
+        path = os.path.join(dir, entry.path)
+        try:
+            if not entry.mode & stat.S_IWRITE:
+                os.chmod(path, stat.S_IWRITE)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    files = [entry for entry in inventory.files if not inventory.is_linked(entry.path)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for _ in executor.map(remove_file, files):
+            pass
+
+    for rel_dir in sorted(inventory.dirs, key=lambda path: path.count(os.sep), reverse=True):
+        if rel_dir and rel_dir not in inventory.linked_dirs:
+            try:
+                os.rmdir(os.path.join(dir, rel_dir))
+            except OSError:
+                pass
+
+    if os.path.exists(dir):
+        shutil.rmtree(dir)
+
+
+class TrashQueue:
+    """
+    Deletes directories in the background after renaming them into a trash directory on the same volume.
+
+    Pending deletions are kept in a queue file, so deletions cut short by an exit are resumed by the next run. The
+    file is shared by every run, and locked while it is updated.
+    """
+
+    def __init__(self, queue_path=TRASH_QUEUE_PATH, workers=DELETE_WORKERS):
+        self.queue_path = queue_path
+        self.workers = workers
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def discard(self, dir, inventory=None):
+        """
+        Rename dir into the trash and queue it for deletion, returning False if it could not be renamed.
+        """
+        trash_dir = get_trash_dir(dir)
+        trash_path = os.path.join(trash_dir, f"{os.path.basename(dir)}-{uuid.uuid4().hex[:8]}")
+
+        try:
+            os.makedirs(trash_dir, exist_ok=True)
+            os.rename(dir, trash_path)
+        except OSError as e:
+            logger.warning(f"Failed to move '{dir}' to trash: {e}")
+            try:
+                os.rmdir(trash_dir)
+            except OSError:
+                pass
+            return False
+
+        self._update_queue_file(add=trash_path)
+        logger.info(f"Moved '{dir}' to '{trash_path}' for background deletion")
+        self._submit(trash_path, inventory)
+        return True
+
+    def resume(self):
+        """
+        Queue the deletions recorded by earlier runs that did not finish.
+        """
+        with self._locked_queue_file():
+            trash_paths = self._read_queue_file()
+
+        for trash_path in trash_paths:
+            if os.path.exists(trash_path):
+                logger.info(f"Resuming background deletion of '{trash_path}'")
+                self._submit(trash_path)
+            else:
+                self._update_queue_file(remove=trash_path)
+
+    def wait(self):
+        """
+        Block until every queued deletion has finished.
+        """
+        if self._pending.unfinished_tasks:
+            logger.info(f"Waiting for {self._pending.unfinished_tasks} background deletions to finish...")
+        self._pending.join()
+
+    def _submit(self, trash_path, inventory=None):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trash', daemon=True)
+                self._thread.start()
+
+        self._pending.put((trash_path, inventory))
+
+    def _run(self):
+        while True:
+            trash_path, inventory = self._pending.get()
+            try:
+                remove_tree(trash_path, inventory, self.workers)
+                self._update_queue_file(remove=trash_path)
+                logger.info(f"Finished background deletion of '{trash_path}'")
+
+                try:
+                    os.rmdir(os.path.dirname(trash_path))
+                except OSError:
+                    pass
+
+            except Exception as e:
+                logger.error(f"Background deletion of '{trash_path}' failed, it will be retried on the next run: {e}")
+
+            finally:
+                self._pending.task_done()
+
+    @contextmanager
+    def _locked_queue_file(self):
+        with self._lock, open(f'{self.queue_path}.lock', 'a+') as lock_file:
+            if sys.platform == 'win32':
+                import msvcrt
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _read_queue_file(self):
+        try:
+            with open(self.queue_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            logger.error(f"Failed to read trash queue {self.queue_path}: {e}")
+            return []
+
+    def _update_queue_file(self, add=None, remove=None):
+        with self._locked_queue_file():
+            paths = [path for path in self._read_queue_file() if path != remove]
+            if add:
+                paths.append(add)
+
+            if paths:
+                with open(self.queue_path, 'w', encoding='utf-8') as f:
+                    json.dump(paths, f, indent=4)
+            elif os.path.exists(self.queue_path):
+                os.remove(self.queue_path)
+
+
+def get_trash_dir(dir):
+    """
+    Get the trash directory for dir: beside the steamapps directory for Steam games, since Steam takes the folders
+    in steamapps/common for games, and beside dir itself otherwise.
+    """
+    parent = os.path.dirname(os.path.abspath(dir))
+    path = parent
+    while os.path.dirname(path) != path:
+        if os.path.basename(path).lower() == 'steamapps':
+            return os.path.join(os.path.dirname(path), TRASH_DIR_NAME)
+        path = os.path.dirname(path)
+
+    return os.path.join(parent, TRASH_DIR_NAME)
+
+
+def get_trash():
+    """
+    Return the trash queue shared by every move in this process.
+    """
+    global _trash
+    with _trash_lock:
+        if _trash is None:
+            _trash = TrashQueue()
+        return _trash
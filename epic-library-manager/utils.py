@@ -1,12 +1,29 @@
-import filecmp
 import json
 import logging
 import os
 import shutil
 import subprocess
-from pathlib import Path
+import time
+from concurrent.futures import as_completed
 
-from tqdm import tqdm
+from dotenv import load_dotenv
+
+from devices import DeviceSlots, describe_device, device_workers, get_device, record_throughput
+from inventory import TreeInventory
+from journal import MoveJournal
+from pipeline import stage
+from progress import get_progress
+from schedule import COPY_SMALL_FILE_SIZE, CopySchedule
+from transfer import FileCopier
+from trash import BACKGROUND_DELETE, get_trash, remove_tree
+from verify import VERIFY_MODES, compare_files
+
+load_dotenv()
+
+COPY_WORKERS = int(os.getenv('COPY_WORKERS', '8'))
+VERIFY_MODE = os.getenv('VERIFY_MODE', 'stat').lower()
+COPY_PIPELINE_MIN_SIZE = int(os.getenv('COPY_PIPELINE_MIN_MB', '256')) * 1024 * 1024
+COPY_RANGE_MIN_SIZE = int(os.getenv('COPY_RANGE_MIN_MB', '2048')) * 1024 * 1024
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +52,21 @@ def close_process(process_name):
         return False
 
 
+def is_process_running(process_name):
+    try:
+        result = subprocess.run(
+            ["tasklist", "/fi", f"imagename eq {process_name}", "/nh"],
+            capture_output=True,
+            text=True,
+            check=False
+        )
+        return process_name.lower() in result.stdout.lower()
+
+    except Exception as e:
+        logger.error(f"Error using tasklist to find {process_name}: {e}")
+        return False
+
+
 def read_json(file_path):
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -53,27 +85,162 @@ def save_json(data, file_path):
         raise
 
 
-def copy_directory(source_dir, target_dir):
-    logger.info(f"Copying files from '{source_dir}' to '{target_dir}'...")
+def scan_directory(dir, workers=None):
+    start_time = time.monotonic()
+    inventory = TreeInventory.scan(dir, workers or COPY_WORKERS)
+    logger.info(
+        f"Scanned {len(inventory.files)} files ({inventory.total_size / (1024 ** 3):.2f} GB) "
+        f"in {len(inventory.dirs)} directories of '{dir}' in {time.monotonic() - start_time:.1f}s"
+    )
+    return inventory
+
+
+def copy_directory(
+        source_dir, target_dir, workers=None, inventory=None, verify_mode=None, manifest_files=None, exclude=None,
+        name=None, on_scan=None
+):
+    workers = workers or COPY_WORKERS
+    verify_mode = (verify_mode or VERIFY_MODE).lower()
+    if verify_mode not in VERIFY_MODES:
+        logger.warning(f"Unknown verify mode '{verify_mode}', using 'stat'")
+        verify_mode = 'stat'
+
+    devices = [get_device(source_dir), get_device(target_dir)]
+    workers = min(device_workers(device, workers) for device in devices)
+
+    logger.info(
+        f"Copying files from '{source_dir}' on {describe_device(devices[0])} "
+        f"to '{target_dir}' on {describe_device(devices[1])} using {workers} workers..."
+    )
+
+    journal = MoveJournal(source_dir, target_dir)
+
+    # Scanning the source and reading the launcher's file list load the source disk, so they count as copying.
+    start_time = time.monotonic()
+    with stage('copy'):
+        try:
+            inventory = inventory or scan_directory(source_dir, workers)
+            if on_scan:
+                on_scan(inventory)
+            if exclude:
+                inventory, _ = exclude.apply(inventory)
+
+            if callable(manifest_files):
+                manifest_files = manifest_files() if verify_mode == 'manifest' else None
+            if verify_mode == 'manifest' and not manifest_files:
+                logger.warning("No launcher file list available for manifest verification, using 'full'")
+                verify_mode = 'full'
+
+            copier = FileCopier(hash_files=verify_mode == 'full')
+            copied = _copytree_with_progress(
+                source_dir, target_dir, workers, copier, journal, inventory, devices, name
+            )
+        except Exception as e:
+            logger.error(f"Failed to copy directory: {e}")
+            copied = False
+
+    if not copied:
+        logger.warning(f"Keeping partial copy in '{target_dir}', run the move again to resume it")
+        return False
 
+    logger.info(f"Copy finished in {time.monotonic() - start_time:.1f}s")
+    record_throughput(devices[0], devices[1], inventory.total_size, time.monotonic() - start_time)
+
+    with stage('verify'):
+        start_time = time.monotonic()
+        verified = _verify_directory_copy(
+            source_dir, target_dir, copier.cloned, inventory, workers, copier.digests, verify_mode, manifest_files,
+            exclude
+        )
+        logger.info(f"Verification ({verify_mode}) finished in {time.monotonic() - start_time:.1f}s")
+
+        if not verified:
+            logger.warning("Copy verification failed. Cleaning up.")
+            remove_dir_if_exists(target_dir, background=True)
+            journal.remove()
+            return False
+
+    journal.remove()
+    logger.info("Successfully copied directory")
+    return True
+
+
+def can_resume_copy(source_dir, target_dir, exclude=None):
+    journal = MoveJournal(source_dir, target_dir)
+    if journal.exists():
+        logger.info(f"Found move journal for '{target_dir}', the copy will be resumed")
+        return True
+
+    logger.info(f"Checking whether existing '{target_dir}' already matches '{source_dir}'...")
     try:
-        _copytree_with_progress(source_dir, target_dir)
+        inventory = scan_directory(source_dir)
+        if exclude:
+            inventory, _ = exclude.apply(inventory)
+
+        mode = VERIFY_MODE if VERIFY_MODE in ('sample', 'full') else 'stat'
+        if not _verify_directory_copy(source_dir, target_dir, inventory=inventory, mode=mode, exclude=exclude):
+            return False
+
+        journal.open()
+        for entry in inventory.files:
+            journal.record(entry.path, entry.size, entry.mtime_ns)
     except Exception as e:
-        logger.error(f"Failed to copy directory: {e}")
-        remove_dir_if_exists(target_dir)
+        logger.error(f"Failed to adopt existing target '{target_dir}': {e}")
+        journal.remove()
         return False
+    finally:
+        journal.close()
+
+    logger.info(f"Adopting existing identical target '{target_dir}'")
+    return True
+
+
+def move_directory(source_dir, target_dir):
+    logger.info(f"Renaming directory '{source_dir}' to '{target_dir}'...")
 
-    if not _verify_directory_copy(source_dir, target_dir):
-        logger.warning("Copy verification failed. Cleaning up.")
-        remove_dir_if_exists(target_dir)
+    try:
+        os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+        os.rename(source_dir, target_dir)
+    except Exception as e:
+        logger.warning(f"Failed to rename directory: {e}")
         return False
 
-    logger.info("Successfully copied directory")
+    logger.info("Successfully renamed directory")
     return True
 
 
-def remove_dir_if_exists(dir):
+def is_same_volume(source_path, target_path):
+    target_path = _nearest_existing_path(target_path)
+
+    try:
+        return os.stat(source_path).st_dev == os.stat(target_path).st_dev
+    except OSError as e:
+        logger.warning(f"Failed to compare volumes of '{source_path}' and '{target_path}': {e}")
+        return False
+
+
+def get_volume(path):
+    try:
+        return os.stat(_nearest_existing_path(path)).st_dev
+    except OSError as e:
+        logger.warning(f"Failed to resolve the volume of '{path}': {e}")
+        return None
+
+
+def get_free_space(path):
     try:
+        return shutil.disk_usage(_nearest_existing_path(path)).free
+    except OSError as e:
+        logger.warning(f"Failed to get the free space of '{path}': {e}")
+        return None
+
+
+def remove_dir_if_exists(dir, inventory=None, workers=None, background=False):
+    try:
+        if background and BACKGROUND_DELETE and os.path.exists(dir) and get_trash().discard(dir, inventory):
+            return True
+        if inventory and os.path.exists(dir):
+            remove_tree(dir, inventory, workers or COPY_WORKERS)
         if os.path.exists(dir):
             shutil.rmtree(dir)
         logger.info(f"Successfully removed directory: {dir}")
@@ -94,42 +261,200 @@ def backup_file(file_path):
         return False
 
 
-def _copytree_with_progress(source, destination):
-    def copy_with_progress(src, dst):
-        shutil.copy2(src, dst)
-        progress_bar.update(os.path.getsize(src))
+def _nearest_existing_path(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent_path = os.path.dirname(path)
+        if parent_path == path:
+            break
+        path = parent_path
+    return path
+
+
+def _copytree_with_progress(
+        source, destination, workers=COPY_WORKERS, copier=None, journal=None, inventory=None, devices=(), name=None
+):
+    def is_completed(entry, dst):
+        recorded = completed.get(entry.path)
+        if not recorded or (recorded['size'], recorded['mtime_ns']) != (entry.size, entry.mtime_ns):
+            return False
+
+        try:
+            target_stat = os.stat(dst)
+        except OSError:
+            return False
+
+        return (target_stat.st_size, target_stat.st_mtime_ns) == (entry.size, entry.mtime_ns)
+
+    def copy(src, dst, entry, chunk_size=None):
+        with slots:
+            backend = _pick_large_file_backend(entry, devices, copier)
+            if entry.size < COPY_SMALL_FILE_SIZE:
+                digest = copier.copy(src, dst, chunk_size, backend)
+                game_progress.advance(entry.size)
+                return digest
+
+            with game_progress.child('file', entry.path, entry.size) as file_progress:
+                return copier.copy(src, dst, chunk_size, backend, file_progress.advance)
 
-    total_size = sum(os.path.getsize(f) for f in Path(source).rglob('*'))
+    def link(existing, src, dst, entry):
+        nonlocal link_error
+        if link_error is None:
+            try:
+                digest = copier.link(existing, dst, entry.size)
+                game_progress.advance(entry.size)
+                return digest
+            except OSError as e:
+                link_error = e
+                logger.warning(f"Failed to recreate hardlinks in '{destination}' ({e}), copying them instead")
+
+        return copy(src, dst, entry)
+
+    link_error = None
 
     try:
-        with tqdm(total=total_size, unit='B', unit_scale=True) as progress_bar:
-            shutil.copytree(source, destination, copy_function=copy_with_progress, ignore=shutil.ignore_patterns(''))
+        resume = journal is not None and journal.exists()
+        completed = journal.load() if resume else {}
+        if journal:
+            journal.open()
+
+        inventory = inventory or TreeInventory.scan(source, workers)
+        copier = copier or FileCopier()
+        slots = DeviceSlots(devices)
+
+        for rel_dir in inventory.dirs:
+            os.makedirs(os.path.join(destination, rel_dir), exist_ok=resume)
+
+        hardlinks = inventory.hardlinks()
+        files = []
+        links = []
+        skipped_size = 0
+        skipped_files = 0
+        for entry in inventory.files:
+            dst = os.path.join(destination, entry.path)
+            if resume and is_completed(entry, dst):
+                skipped_size += entry.size
+                skipped_files += 1
+                if completed[entry.path].get('hash'):
+                    copier.digests[dst] = completed[entry.path]['hash']
+                continue
+
+            src = os.path.join(source, entry.path)
+            if entry.path in hardlinks:
+                links.append((os.path.join(destination, hardlinks[entry.path]), src, dst, entry))
+            else:
+                files.append((src, dst, entry))
+
+        if resume:
+            logger.info(
+                f"Resuming copy, {len(completed)} files already completed, {len(files) + len(links)} files remaining"
+            )
+
+        if links:
+            logger.info(f"Recreating {len(links)} hardlinks after copying the files they point to")
+
+        total_size = sum(entry.size for _, _, entry in files) + sum(entry.size for _, _, _, entry in links)
+
+        sample = next((src for src, _, entry in files if entry.size), None)
+        if sample:
+            copier.probe(sample, destination)
+
+        schedule = CopySchedule(files, workers)
+        try:
+            with get_progress().game(
+                    name or os.path.basename(source), total_size + skipped_size, len(inventory.files), skipped_size,
+                    skipped_files
+            ) as game_progress:
+                futures = schedule.submit(copy)
+                for future in as_completed(futures):
+                    digest = future.result()
+                    entry = futures[future]
+                    if journal:
+                        journal.record(entry.path, entry.size, entry.mtime_ns, digest)
+                    game_progress.advance(items=1)
+
+                for existing, src, dst, entry in links:
+                    digest = link(existing, src, dst, entry)
+                    if journal:
+                        journal.record(entry.path, entry.size, entry.mtime_ns, digest)
+                    game_progress.advance(items=1)
+        finally:
+            schedule.shutdown()
+
+        copier.log_summary()
+        schedule.log_summary()
+
+        for rel_dir in reversed(inventory.dirs):
+            shutil.copystat(os.path.join(source, rel_dir), os.path.join(destination, rel_dir))
+
         return True
 
     except Exception as e:
         logger.error(f"Copy function failed: {e}")
         return False
 
+    finally:
+        if journal:
+            journal.close()
 
-def _verify_directory_copy(source_dir, target_dir):
-    def compare_directories(dcmp):
-        if dcmp.left_only or dcmp.right_only or dcmp.diff_files:
-            logger.info(f"Differences found: {dcmp.diff_files}")
-            return False
 
-        for sub_dcmp in dcmp.subdirs.values():
-            if not compare_directories(sub_dcmp):
-                return False
+def _pick_large_file_backend(entry, devices, copier):
+    if entry.size >= COPY_RANGE_MIN_SIZE and not copier.hash_algorithm and devices:
+        if all(device.rotational is False for device in devices):
+            return 'ranges'
+
+    if entry.size >= COPY_PIPELINE_MIN_SIZE:
+        return 'pipelined'
+
+    return None
 
+
+def _verify_directory_copy(
+        source_dir, target_dir, cloned_files=frozenset(), inventory=None, workers=COPY_WORKERS, digests=None,
+        mode=VERIFY_MODE, manifest_files=None, exclude=None
+):
+    if mode == 'none':
+        logger.info(f"Skipping verification of '{target_dir}'")
         return True
 
     try:
-        dircmp = filecmp.dircmp(source_dir, target_dir, ignore=None)
-        if compare_directories(dircmp):
-            return True
+        inventory = inventory or TreeInventory.scan(source_dir, workers)
+        target_inventory = TreeInventory.scan(target_dir, workers)
+        if exclude:
+            inventory, _ = exclude.apply(inventory)
+            target_inventory, _ = exclude.apply(target_inventory)
 
-        return False
+        target_files = {entry.path: entry for entry in target_inventory.files}
+        source_paths = set()
+        missing = []
+        common = []
+        for entry in inventory.files:
+            source_paths.add(entry.path)
+            target_entry = target_files.get(entry.path)
+            if target_entry is None:
+                missing.append(entry.path)
+            else:
+                common.append((entry, target_entry))
+
+        extra = sorted(target_files.keys() - source_paths)
+        diff_dirs = sorted(set(inventory.dirs) ^ set(target_inventory.dirs))
+        diff_files = compare_files(
+            source_dir, target_dir, common, mode, cloned_files, digests, manifest_files=manifest_files
+        )
+
+        if mode == 'manifest':
+            target_paths = {os.path.normcase(path) for path in target_files}
+            missing += sorted(
+                path for path in manifest_files
+                if path not in target_paths and not (exclude and exclude.matches(path))
+            )
+
+        if missing or extra or diff_files or diff_dirs:
+            logger.info(f"Differences found: {(missing + extra + diff_files + diff_dirs)[:20]}")
+            return False
+
+        return True
 
     except Exception as e:
         logger.error(f"Copy verification failed: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -12,12 +12,14 @@ logger = logging.getLogger(__name__)
 
 
 class Game:
-    def __init__(self, game_id, name, install_dir, base_dir, index=None):
+    def __init__(self, game_id, name, install_dir, base_dir, index=None, last_played=None, size=None):
         self.index = index
         self.game_id = game_id
         self.name = name
         self.install_dir = install_dir
         self.base_dir = base_dir
+        self.last_played = last_played
+        self.size = size
 
     def __repr__(self):
         return f"Game({self.name}, {self.install_dir})"
@@ -79,7 +81,9 @@ def fetch_steam_games():
                     game_id=app_state.get('appid'),
                     name=app_state.get('name'),
                     install_dir=install_dir,
-                    base_dir=steamapps_dir
+                    base_dir=steamapps_dir,
+                    last_played=int(app_state.get('LastPlayed') or 0) or None,
+                    size=int(app_state.get('SizeOnDisk') or 0) or None
                 )
                 games.append(game)
 
@@ -0,0 +1,167 @@
+import logging
+import os
+import struct
+
+from dotenv import load_dotenv
+from vdf import parse
+
+load_dotenv()
+
+STEAM_LIBFOLDERS_PATH = os.getenv('STEAM_LIBFOLDERS_PATH')
+
+PAYLOAD_MAGIC = 0x71F617D0
+METADATA_MAGIC = 0x1F4812BE
+SIGNATURE_MAGIC = 0x1B81B817
+END_OF_MANIFEST_MAGIC = 0x32C415AB
+
+FLAG_USER_CONFIG = 0x1
+FLAG_VERSIONED_USER_CONFIG = 0x2
+FLAG_DIRECTORY = 0x40
+FLAG_SYMLINK = 0x200
+
+logger = logging.getLogger(__name__)
+
+
+def get_manifest_files(game):
+    """
+    Get the files Steam expects in the game's install directory, from its installed depot manifests.
+
+    Returns a dict of normalised relative path to (size, sha1 hex or None), or None if unavailable.
+    """
+    app_manifest_path = os.path.join(game.base_dir, f"appmanifest_{game.game_id}.acf")
+
+    try:
+        with open(app_manifest_path, encoding='utf-8') as appmanifest_raw_vdf:
+            app_state = parse(appmanifest_raw_vdf).get('AppState', {})
+    except Exception as e:
+        logger.error(f"Failed to parse appmanifest_{game.game_id}.acf: {e}")
+        return None
+
+    installed_depots = app_state.get('InstalledDepots', {})
+    if not installed_depots:
+        logger.warning(f"No installed depots listed for game '{game.name}'")
+        return None
+
+    files = {}
+    conflicts = set()
+    for depot_id, depot in installed_depots.items():
+        manifest_path = _find_depot_manifest(game, depot_id, depot.get('manifest'))
+        if not manifest_path:
+            logger.warning(f"Depot manifest {depot_id}_{depot.get('manifest')} not found for game '{game.name}'")
+            return None
+
+        try:
+            depot_files = _read_depot_manifest(manifest_path)
+        except Exception as e:
+            logger.error(f"Failed to read depot manifest {manifest_path}: {e}")
+            return None
+
+        if depot_files is None:
+            logger.warning(f"Depot manifest {manifest_path} has encrypted filenames")
+            return None
+
+        for path, entry in depot_files.items():
+            if path in files and files[path] != entry:
+                conflicts.add(path)
+            files[path] = entry
+
+    for path in conflicts:
+        files[path] = (files[path][0], None)
+
+    logger.info(f"Loaded {len(files)} files from {len(installed_depots)} depot manifests for game '{game.name}'")
+    return files
+
+
+def _find_depot_manifest(game, depot_id, manifest_id):
+    depotcache_dirs = [os.path.join(game.base_dir, 'depotcache')]
+    if STEAM_LIBFOLDERS_PATH:
+        steam_dir = os.path.dirname(os.path.dirname(STEAM_LIBFOLDERS_PATH))
+        depotcache_dirs.append(os.path.join(steam_dir, 'depotcache'))
+
+    for depotcache_dir in depotcache_dirs:
+        manifest_path = os.path.join(depotcache_dir, f"{depot_id}_{manifest_id}.manifest")
+        if os.path.exists(manifest_path):
+            return manifest_path
+
+    return None
+
+
+def _read_depot_manifest(manifest_path):
+    with open(manifest_path, 'rb') as f:
+        data = f.read()
+
+    payload = None
+    filenames_encrypted = False
+    offset = 0
+    while offset + 4 <= len(data):
+        magic, = struct.unpack_from('<I', data, offset)
+        if magic == END_OF_MANIFEST_MAGIC:
+            break
+
+        length, = struct.unpack_from('<I', data, offset + 4)
+        section = data[offset + 8:offset + 8 + length]
+        offset += 8 + length
+
+        if magic == PAYLOAD_MAGIC:
+            payload = section
+        elif magic == METADATA_MAGIC:
+            filenames_encrypted = any(field == 4 and value for field, value in _decode_protobuf(section))
+        elif magic != SIGNATURE_MAGIC:
+            raise ValueError(f"Unknown depot manifest section: {magic:#x}")
+
+    if payload is None:
+        raise ValueError("Depot manifest has no payload")
+
+    if filenames_encrypted:
+        return None
+
+    files = {}
+    for field, mapping in _decode_protobuf(payload):
+        if field != 1:
+            continue
+
+        values = dict(_decode_protobuf(mapping))
+        if values.get(3, 0) & (FLAG_DIRECTORY | FLAG_SYMLINK | FLAG_USER_CONFIG | FLAG_VERSIONED_USER_CONFIG):
+            continue
+
+        path = values.get(1, b'').decode('utf-8').rstrip('\0').replace('\\', os.sep).replace('/', os.sep)
+        sha_content = values.get(5)
+        files[os.path.normcase(path)] = (values.get(2, 0), sha_content.hex() if sha_content else None)
+
+    return files
+
+
+def _decode_protobuf(data):
+    offset = 0
+    while offset < len(data):
+        key, offset = _decode_varint(data, offset)
+        field, wire_type = key >> 3, key & 0x7
+
+        if wire_type == 0:
+            value, offset = _decode_varint(data, offset)
+        elif wire_type == 1:
+            value, = struct.unpack_from('<Q', data, offset)
+            offset += 8
+        elif wire_type == 2:
+            length, offset = _decode_varint(data, offset)
+            value = data[offset:offset + length]
+            offset += length
+        elif wire_type == 5:
+            value, = struct.unpack_from('<I', data, offset)
+            offset += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type: {wire_type}")
+
+        yield field, value
+
+
+def _decode_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
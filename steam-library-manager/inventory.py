@@ -0,0 +1,87 @@
+import logging
+import os
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+FileEntry = namedtuple('FileEntry', ['path', 'size', 'mtime_ns', 'mode', 'ino', 'dev', 'nlink'])
+
+logger = logging.getLogger(__name__)
+
+
+class TreeInventory:
+    """
+    Flat listing of every directory and file below a root, built with a single parallel scan.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.dirs = []
+        self.files = []
+        self.linked_dirs = set()
+
+    @property
+    def total_size(self):
+        return sum(entry.size for entry in self.files)
+
+    def is_linked(self, rel_path):
+        """
+        Whether rel_path was reached through a symlinked directory, and so must not be deleted in place.
+        """
+        return os.path.dirname(rel_path) in self.linked_dirs
+
+    def hardlinks(self):
+        """
+        Map each extra name of a hardlinked file to the first of its names, by path, within this tree.
+        """
+        groups = defaultdict(list)
+        for entry in self.files:
+            if entry.nlink > 1 and entry.ino:
+                groups[(entry.dev, entry.ino)].append(entry.path)
+
+        links = {}
+        for paths in groups.values():
+            primary, *others = sorted(paths)
+            for path in others:
+                links[path] = primary
+
+        return links
+
+    @classmethod
+    def scan(cls, root, workers=8):
+        """
+        Scan root with os.scandir on a thread pool, following directory symlinks like shutil.copytree.
+        """
+        inventory = cls(root)
+        inventory.dirs.append('')
+
+        def scan_dir(rel_dir, linked):
+            subdirs, files = [], []
+            with os.scandir(os.path.join(root, rel_dir)) as entries:
+                for entry in entries:
+                    rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    if entry.is_dir():
+                        subdirs.append((rel_path, linked or entry.is_symlink()))
+                    else:
+                        stat = entry.stat()
+                        files.append(FileEntry(
+                            rel_path, stat.st_size, stat.st_mtime_ns, stat.st_mode,
+                            stat.st_ino, stat.st_dev, stat.st_nlink
+                        ))
+
+            return subdirs, files
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            pending = {executor.submit(scan_dir, '', False)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    subdirs, files = future.result()
+                    inventory.files.extend(files)
+
+                    for rel_path, linked in subdirs:
+                        inventory.dirs.append(rel_path)
+                        if linked:
+                            inventory.linked_dirs.add(rel_path)
+                        pending.add(executor.submit(scan_dir, rel_path, linked))
+
+        return inventory
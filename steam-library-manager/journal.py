@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journals')
+JOURNAL_SYNC_INTERVAL = float(os.getenv('JOURNAL_SYNC_SECONDS') or '5')
+JOURNAL_SYNC_FILES = int(os.getenv('JOURNAL_SYNC_FILES') or '1000')
+
+logger = logging.getLogger(__name__)
+
+
+class MoveJournal:
+    """
+    Append-only record of the files already copied for one source/target move.
+
+    Entries are written in batches: the files and directories they cover are synced to disk first, then the entries
+    and the journal itself, so a resume after a crash never trusts a copy that only ever reached the page cache.
+    """
+
+    def __init__(self, source_dir, target_dir):
+        self.source_dir = os.path.abspath(source_dir)
+        self.target_dir = os.path.abspath(target_dir)
+        self._file = None
+        self._pending = []
+        self._synced_dirs = set()
+        self._synced = time.monotonic()
+
+        key = f"{os.path.normcase(self.source_dir)}|{os.path.normcase(self.target_dir)}"
+        self.path = os.path.join(JOURNAL_DIR, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.jsonl")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """
+        Read completed file entries keyed by relative path, ignoring a torn final line.
+        """
+        entries = {}
+        if not self.exists():
+            return entries
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if 'path' in entry:
+                    entries[entry['path']] = entry
+
+        logger.info(f"Loaded {len(entries)} completed files from move journal: {self.path}")
+        return entries
+
+    def open(self):
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        is_new = not self.exists()
+
+        self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+        self._synced = time.monotonic()
+        if is_new:
+            self._write({'source': self.source_dir, 'target': self.target_dir})
+            self._sync_file()
+            _fsync(JOURNAL_DIR, directory=True)
+
+    def record(self, path, size, mtime_ns, digest=None):
+        entry = {'path': path, 'size': size, 'mtime_ns': mtime_ns}
+        if digest:
+            entry['hash'] = digest
+
+        self._pending.append(entry)
+        if len(self._pending) >= JOURNAL_SYNC_FILES or time.monotonic() - self._synced >= JOURNAL_SYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        """
+        Sync the target files of the pending entries and their directories, then append the entries durably.
+        """
+        pending, self._pending = self._pending, []
+        self._synced = time.monotonic()
+        if not pending:
+            return
+
+        dirs = set()
+        for entry in pending:
+            target = os.path.join(self.target_dir, entry['path'])
+            _fsync(target)
+            dirs.add(os.path.dirname(target))
+
+        # Every batch adds files to the directories holding them, while the directories above those only need
+        # syncing once, after they were created.
+        top = os.path.dirname(self.target_dir)
+        for dir in list(dirs):
+            while dir != top and dir not in self._synced_dirs:
+                self._synced_dirs.add(dir)
+                dir = os.path.dirname(dir)
+                dirs.add(dir)
+        for dir in dirs:
+            _fsync(dir, directory=True)
+
+        for entry in pending:
+            self._write(entry)
+        self._sync_file()
+
+    def close(self):
+        if self._file:
+            try:
+                self.sync()
+            except OSError as e:
+                logger.warning(f"Failed to sync move journal {self.path}, its last files will be copied again: {e}")
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self._pending = []
+        self.close()
+        try:
+            if self.exists():
+                os.remove(self.path)
+        except OSError as e:
+            logger.warning(f"Failed to remove move journal {self.path}: {e}")
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+
+    def _sync_file(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+def _fsync(path, directory=False):
+    if sys.platform == 'win32':
+        # Windows cannot sync directories, and syncs files only through a handle open for writing, which read-only
+        # files refuse; those are left to the system's own write-back.
+        if directory:
+            return
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_BINARY)
+        except PermissionError:
+            return
+    else:
+        fd = os.open(path, os.O_RDONLY)
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -2,8 +2,22 @@ import logging
 import os
 from collections import defaultdict
 
+from excludes import ExcludeRules
 from fetch import fetch_steam_games
-from utils import copy_directory, copy_file, remove_dir_if_exists, remove_file_if_exists
+from filelist import get_manifest_files
+from pipeline import stage
+from utils import (
+    can_resume_copy, copy_directory, copy_file, is_same_volume, move_directory, remove_dir_if_exists,
+    remove_file_if_exists
+)
+
+# Regenerable data left behind when a game is copied: crash dumps, logs.
+EXCLUDE_DEFAULTS = [
+    '*.dmp',
+    '*.mdmp',
+    'Saved/Crashes',
+    'Saved/Logs',
+]
 
 logger = logging.getLogger(__name__)
 
@@ -42,15 +56,31 @@ def get_game_from_dict(games_dict, lookup_value, by_index=False):
     return None
 
 
-def process_game(game, target_base_dir):
+def get_library_dir(game):
+    """Get the library the game is installed in, as listed in INSTALL_DIR_OPTIONS."""
+    return os.path.dirname(game.base_dir)
+
+
+def get_target_dir(game, target_base_dir):
+    """Get the directory the game is installed to when moved to target_base_dir."""
+    return os.path.join(target_base_dir, 'steamapps', 'common', os.path.basename(game.install_dir))
+
+
+def process_game(game, target_base_dir, workers=None, verify_mode=None):
     """Process the game, including copying files, updating the manifest, and cleaning up old files."""
     if not os.path.exists(game.install_dir):
         logger.error(f"Source game directory does not exist: {game.install_dir}")
         return False
 
-    target_dir = os.path.join(target_base_dir, 'steamapps', 'common', os.path.basename(game.install_dir))
+    target_dir = get_target_dir(game, target_base_dir)
+
+    if os.path.normcase(os.path.abspath(target_dir)) == os.path.normcase(os.path.abspath(game.install_dir)):
+        logger.info(f"Game '{game.name}' is already installed in: {target_dir}")
+        return True
+
+    exclude = ExcludeRules.from_env(EXCLUDE_DEFAULTS)
 
-    if os.path.exists(target_dir):
+    if os.path.exists(target_dir) and not can_resume_copy(game.install_dir, target_dir, exclude):
         logger.error(f"Target game directory already exists: {target_dir}")
         return False
 
@@ -66,30 +96,46 @@ def process_game(game, target_base_dir):
         return False
 
     original_install_dir, original_base_dir = game.get_dirs()
+    renamed = False
 
     def rollback():
         game.set_dirs(original_install_dir, original_base_dir)
-        remove_dir_if_exists(target_dir)
+        if renamed:
+            move_directory(target_dir, original_install_dir)
+        else:
+            remove_dir_if_exists(target_dir, background=True)
         remove_file_if_exists(target_manifest)
 
     try:
-        if not copy_directory(game.install_dir, target_dir):
-            logger.error(f"Failed to copy directory for game '{game.name}'")
-            rollback()
-            return False
-
-        logger.info(f"Successfully copied directory for game '{game.name}'")
-
-        if not copy_file(source_manifest, target_manifest):
-            logger.error(f"Failed to update manifest for game '{game.name}'")
-            rollback()
-            return False
-
-        logger.info(f"Successfully updated manifest for game '{game.name}'")
-
-        remove_dir_if_exists(original_install_dir)
-        remove_file_if_exists(source_manifest)
-        return True
+        if not os.path.exists(target_dir) and is_same_volume(game.install_dir, target_base_dir):
+            logger.info(f"Source and target share a volume, renaming directory for game '{game.name}'")
+            renamed = move_directory(game.install_dir, target_dir)
+
+        if not renamed:
+            scanned = []
+            if not copy_directory(
+                    game.install_dir, target_dir, workers=workers, verify_mode=verify_mode,
+                    manifest_files=lambda: get_manifest_files(game), exclude=exclude, name=game.name,
+                    on_scan=scanned.append
+            ):
+                logger.error(f"Failed to copy directory for game '{game.name}'")
+                return False
+
+        logger.info(f"Successfully {'renamed' if renamed else 'copied'} directory for game '{game.name}'")
+
+        with stage('commit'):
+            if not copy_file(source_manifest, target_manifest):
+                logger.error(f"Failed to update manifest for game '{game.name}'")
+                rollback()
+                return False
+
+            logger.info(f"Successfully updated manifest for game '{game.name}'")
+
+            if not renamed:
+                remove_dir_if_exists(original_install_dir, scanned[0] if scanned else None, workers, background=True)
+
+            remove_file_if_exists(source_manifest)
+            return True
 
     except Exception as e:
         logger.error(f"Unexpected error processing game '{game.name}': {e}")
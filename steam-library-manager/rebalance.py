@@ -0,0 +1,246 @@
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from planner import PLAN_FREE_SPACE_RESERVE, PLAN_SCAN_WORKERS, measure_game
+from utils import get_volume
+
+load_dotenv()
+
+REBALANCE_QUOTAS = os.getenv('REBALANCE_QUOTAS', '')
+REBALANCE_MIN_FREE = os.getenv('REBALANCE_MIN_FREE', '')
+REBALANCE_TOLERANCE = int(float(os.getenv('REBALANCE_TOLERANCE_GB', '5')) * 1024 ** 3)
+REBALANCE_UNIT = int(float(os.getenv('REBALANCE_UNIT_MB', '256')) * 1024 ** 2)
+
+logger = logging.getLogger(__name__)
+
+
+class Location:
+    """
+    A volume games can be installed on, through the first of the install locations that lie on it.
+
+    cap is the most game data the volume may hold, from its quota, its minimum free ratio and the free space
+    reserve; target is the game data it should hold once the library is balanced.
+    """
+
+    def __init__(self, path, volume, total, free):
+        self.path = path
+        self.volume = volume
+        self.total = total
+        self.free = free
+        self.games = []
+        self.games_size = 0
+        self.cap = 0
+        self.target = 0
+
+    @property
+    def other_size(self):
+        return self.total - self.free - self.games_size
+
+
+def measure_games(games, get_manifest_files=None, scan=False):
+    """
+    Measure games in parallel, returning a dict of game_id to (size, files).
+    """
+    def measure(game):
+        try:
+            return game.game_id, measure_game(game, get_manifest_files, scan)
+        except OSError as e:
+            logger.warning(f"Failed to measure '{game.name}', leaving it in place: {e}")
+            return game.game_id, None
+
+    with ThreadPoolExecutor(max_workers=max(1, PLAN_SCAN_WORKERS)) as executor:
+        return {game_id: measured for game_id, measured in executor.map(measure, games) if measured}
+
+
+def get_locations(paths, games, sizes, get_library_dir, quotas=None, min_free=None):
+    """
+    Group install locations by volume and assign each measured game to the location it is installed in, the one
+    get_library_dir(game) returns.
+
+    quotas and min_free map install locations to the most game data in bytes and the least free ratio their volume
+    may have. Games installed elsewhere are left out and count as other data on their volume.
+    """
+    quotas = _by_path(quotas)
+    min_free = _by_path(min_free)
+
+    locations = {}
+    location_of = {}
+    for path in filter(None, (path.strip() for path in paths)):
+        if not os.path.isdir(path):
+            logger.warning(f"Install location '{path}' does not exist, leaving it out")
+            continue
+
+        volume = get_volume(path)
+        if volume not in locations:
+            usage = shutil.disk_usage(path)
+            locations[volume] = Location(path, volume, usage.total, usage.free)
+        location_of[_key(path)] = locations[volume]
+
+    for game in games:
+        location = location_of.get(_key(get_library_dir(game)))
+        if location and game.game_id in sizes:
+            location.games.append(game)
+            location.games_size += sizes[game.game_id][0]
+
+    for location in locations.values():
+        location.cap = location.total - location.other_size - PLAN_FREE_SPACE_RESERVE
+    for path, location in location_of.items():
+        if path in quotas:
+            location.cap = min(location.cap, quotas[path])
+        if path in min_free:
+            location.cap = min(location.cap, int(location.total * (1 - min_free[path])) - location.other_size)
+
+    for location in locations.values():
+        location.cap = max(0, location.cap)
+
+    return list(locations.values())
+
+
+def plan_rebalance(games, paths, get_library_dir, get_manifest_files=None, scan=False, quotas=None, min_free=None):
+    """
+    Spread games over the install locations so their volumes end up with the same free ratio, within their quotas
+    and minimum free ratios, moving as few bytes as possible.
+
+    Returns the (game, target_base_dir) moves and the measured sizes, a dict of game_id to (size, files).
+    """
+    sizes = measure_games(games, get_manifest_files, scan)
+    locations = get_locations(paths, games, sizes, get_library_dir, quotas, min_free)
+    if len(locations) < 2:
+        logger.info("Rebalancing needs install locations on at least two volumes")
+        return [], sizes
+
+    _balance(locations)
+    for location in locations:
+        logger.info(
+            f"Location '{location.path}': {location.games_size / 1024 ** 3:.2f} GB of games, "
+            f"target {location.target / 1024 ** 3:.2f} GB, {location.free / location.total:.0%} free"
+        )
+
+    leaving = []
+    for location in locations:
+        surplus = location.games_size - location.target
+        if surplus > REBALANCE_TOLERANCE:
+            games_by_size = sorted(location.games, key=lambda game: -sizes[game.game_id][0])
+            shed = select_games(games_by_size, sizes, surplus - REBALANCE_TOLERANCE)
+            leaving.extend((game, location) for game in shed)
+
+    room = {location.volume: location.target - location.games_size for location in locations}
+    moves = []
+    for game, source in sorted(leaving, key=lambda item: -sizes[item[0].game_id][0]):
+        size = sizes[game.game_id][0]
+        candidates = [location for location in locations if location is not source and room[location.volume] >= size]
+        if not candidates:
+            logger.warning(f"No location has room for '{game.name}', leaving it in '{source.path}'")
+            continue
+
+        target = max(candidates, key=lambda location: room[location.volume])
+        room[target.volume] -= size
+        room[source.volume] += size
+        moves.append((game, target.path))
+
+    logger.info(
+        f"Rebalancing moves {len(moves)} games, "
+        f"{sum(sizes[game.game_id][0] for game, _ in moves) / 1024 ** 3:.2f} GB"
+    )
+    return moves, sizes
+
+
+def select_games(games, sizes, need):
+    """
+    Pick the games whose sizes add up to the least total of at least need bytes, preferring earlier games.
+
+    This is a subset sum over sizes rounded to REBALANCE_UNIT, with the reachable totals kept as the bits of an
+    integer so each game costs one shift and one or over the whole range.
+    """
+    if need <= 0:
+        return []
+    if sum(sizes[game.game_id][0] for game in games) < need:
+        return list(games)
+
+    units = [max(1, round(sizes[game.game_id][0] / REBALANCE_UNIT)) for game in games]
+    need_units = -(-need // REBALANCE_UNIT)
+    mask = (1 << (need_units + max(units) + 1)) - 1
+
+    reachable = 1
+    history = []
+    for unit in units:
+        history.append(reachable)
+        reachable = (reachable | (reachable << unit)) & mask
+
+    above = reachable >> need_units
+    if not above:
+        return list(games)
+    total = need_units + (above & -above).bit_length() - 1
+
+    selected = []
+    for index in range(len(games) - 1, -1, -1):
+        if not history[index] >> total & 1:
+            selected.append(games[index])
+            total -= units[index]
+    return selected[::-1]
+
+
+def parse_location_values(items, scale=1.0):
+    """
+    Parse path=value items into a dict of path to value times scale, skipping malformed items.
+    """
+    values = {}
+    for item in filter(None, (item.strip() for item in items)):
+        path, _, value = item.rpartition('=')
+        try:
+            values[path.strip()] = float(value) * scale
+        except ValueError:
+            logger.warning(f"Ignoring location setting '{item}'")
+    return values
+
+
+def get_quotas(items=None):
+    """
+    Get the per-location quotas in bytes, from path=GB items or REBALANCE_QUOTAS.
+    """
+    return parse_location_values(items or REBALANCE_QUOTAS.split(','), 1024 ** 3)
+
+
+def get_min_free(items=None):
+    """
+    Get the per-location minimum free ratios, from path=ratio items or REBALANCE_MIN_FREE.
+    """
+    return parse_location_values(items or REBALANCE_MIN_FREE.split(','))
+
+
+def _balance(locations):
+    total_games = sum(location.games_size for location in locations)
+    if total_games >= sum(location.cap for location in locations):
+        logger.warning("The games do not fit within the locations' quotas, filling every location to its quota")
+        for location in locations:
+            location.target = location.cap
+        return
+
+    def targets(ratio):
+        return [
+            min(location.cap, max(0, location.games_size + location.free - int(ratio * location.total)))
+            for location in locations
+        ]
+
+    low, high = 0.0, 1.0
+    for _ in range(50):
+        ratio = (low + high) / 2
+        if sum(targets(ratio)) >= total_games:
+            low = ratio
+        else:
+            high = ratio
+
+    for location, target in zip(locations, targets(low)):
+        location.target = target
+
+
+def _by_path(values):
+    return {_key(path): value for path, value in (values or {}).items()}
+
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COPY_SMALL_FILE_SIZE = int(os.getenv('COPY_SMALL_FILE_KB', '1024')) * 1024
+COPY_LARGE_WORKERS = int(os.getenv('COPY_LARGE_WORKERS', '1'))
+COPY_LARGE_CHUNK_SIZE = int(os.getenv('COPY_LARGE_CHUNK_MB', '64')) * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class SizeClass:
+    """
+    A group of files copied on its own pool, with the throughput it achieved.
+    """
+
+    def __init__(self, name, workers, chunk_size=None):
+        self.name = name
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.files = []
+        self.copied_files = 0
+        self.copied_size = 0
+        self.started = None
+        self.finished = None
+
+    @property
+    def size(self):
+        return sum(entry.size for _, _, entry in self.files)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+
+class CopySchedule:
+    """
+    Split a copy into small files, spread over a wide pool, and large files, streamed a few at a time with big
+    buffers in directory and inode order so that spinning disks read them sequentially.
+    """
+
+    def __init__(self, files, workers, small_file_size=None, large_workers=None, large_chunk_size=None):
+        small_file_size = COPY_SMALL_FILE_SIZE if small_file_size is None else small_file_size
+
+        self.small = SizeClass('small', workers)
+        self.large = SizeClass(
+            'large', min(workers, large_workers or COPY_LARGE_WORKERS), large_chunk_size or COPY_LARGE_CHUNK_SIZE
+        )
+        self._executors = []
+        self._lock = threading.Lock()
+
+        for file in files:
+            (self.small if file[2].size < small_file_size else self.large).files.append(file)
+
+        self.small.files.sort(key=lambda file: file[2].path)
+        self.large.files.sort(key=lambda file: (os.path.dirname(file[2].path), file[2].ino, file[2].path))
+
+    @property
+    def classes(self):
+        return [size_class for size_class in (self.large, self.small) if size_class.files]
+
+    def submit(self, copy):
+        """
+        Start copying every file with copy(src, dst, entry, chunk_size), returning a dict of future to file entry.
+        """
+        futures = {}
+        for size_class in self.classes:
+            executor = ThreadPoolExecutor(max_workers=size_class.workers)
+            self._executors.append(executor)
+
+            logger.info(
+                f"Copying {len(size_class.files)} {size_class.name} files "
+                f"({size_class.size / (1024 ** 3):.2f} GB) on {size_class.workers} workers"
+            )
+
+            for src, dst, entry in size_class.files:
+                futures[executor.submit(self._run, size_class, copy, src, dst, entry)] = entry
+
+        return futures
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._executors = []
+
+    def log_summary(self):
+        """
+        Log the files, bytes and throughput of each size class.
+        """
+        for size_class in self.classes:
+            throughput = size_class.copied_size / size_class.elapsed if size_class.elapsed else 0.0
+            logger.info(
+                f"Size class '{size_class.name}': {size_class.copied_files} files, "
+                f"{size_class.copied_size / (1024 ** 3):.2f} GB in {size_class.elapsed:.1f}s "
+                f"({throughput / (1024 ** 2):.1f} MB/s)"
+            )
+
+    def _run(self, size_class, copy, src, dst, entry):
+        with self._lock:
+            if size_class.started is None:
+                size_class.started = time.monotonic()
+
+        digest = copy(src, dst, entry, size_class.chunk_size)
+
+        with self._lock:
+            size_class.copied_files += 1
+            size_class.copied_size += entry.size
+            size_class.finished = time.monotonic()
+
+        return digest
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The shared modules are kept identical in every launcher's directory, so the tests import Steam's copy.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'steam-library-manager'))
@@ -0,0 +1,46 @@
+from excludes import ExcludeRules
+from inventory import TreeInventory
+
+
+def test_unanchored_pattern_matches_at_any_depth():
+    rules = ExcludeRules(['shadercache'])
+    assert rules.matches('shadercache')
+    assert rules.matches('Game/ShaderCache/data.bin')
+    assert not rules.matches('Game/shadercache2')
+
+
+def test_anchored_pattern_matches_only_at_the_top():
+    rules = ExcludeRules(['/Logs'])
+    assert rules.matches('Logs/today.txt')
+    assert not rules.matches('Game/Logs/today.txt')
+
+
+def test_backslash_pattern_is_anchored_like_slash():
+    rules = ExcludeRules(['\\Logs\\*.txt'])
+    assert rules.matches('Logs/today.txt')
+    assert not rules.matches('Game/Logs/today.txt')
+
+
+def test_wildcards_stay_within_a_component():
+    rules = ExcludeRules(['*.tmp', 'cache?'])
+    assert rules.matches('data/file.tmp')
+    assert rules.matches('cache1/file')
+    assert not rules.matches('cache12/file')
+
+
+def test_no_patterns_match_nothing():
+    rules = ExcludeRules()
+    assert not rules
+    assert not rules.matches('anything')
+
+
+def test_apply_drops_excluded_files_and_dirs(tmp_path):
+    (tmp_path / 'Logs').mkdir()
+    (tmp_path / 'Logs' / 'today.txt').write_bytes(b'log')
+    (tmp_path / 'data.pak').write_bytes(b'data')
+
+    included, excluded = ExcludeRules(['/Logs']).apply(TreeInventory.scan(str(tmp_path)))
+
+    assert [entry.path for entry in included.files] == ['data.pak']
+    assert 'Logs' not in included.dirs
+    assert [entry.path.replace('\\', '/') for entry in excluded] == ['Logs/today.txt']
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from rebalance import REBALANCE_UNIT, select_games
+
+
+def make_games(*units):
+    games = [SimpleNamespace(game_id=str(index), name=f"Game {index}") for index in range(len(units))]
+    sizes = {game.game_id: (unit * REBALANCE_UNIT, None) for game, unit in zip(games, units)}
+    return games, sizes
+
+
+def test_nothing_needed_selects_nothing():
+    games, sizes = make_games(4, 2)
+    assert select_games(games, sizes, 0) == []
+
+
+def test_selects_the_least_total_covering_the_need():
+    games, sizes = make_games(10, 6, 5, 3)
+    assert [game.game_id for game in select_games(games, sizes, 8 * REBALANCE_UNIT)] == ['2', '3']
+
+
+def test_exact_fit_is_preferred_over_a_single_larger_game():
+    games, sizes = make_games(20, 7, 3)
+    assert [game.game_id for game in select_games(games, sizes, 10 * REBALANCE_UNIT)] == ['1', '2']
+
+
+def test_earlier_games_win_ties():
+    games, sizes = make_games(4, 4, 4)
+    assert [game.game_id for game in select_games(games, sizes, 3 * REBALANCE_UNIT)] == ['0']
+
+
+def test_every_game_is_selected_when_they_cannot_cover_the_need():
+    games, sizes = make_games(2, 3)
+    assert select_games(games, sizes, 10 * REBALANCE_UNIT) == games
@@ -0,0 +1,79 @@
+import errno
+import os
+
+import pytest
+
+import transfer
+from hashing import hash_file
+from throttle import RateLimiter
+from transfer import FileCopier
+
+pytestmark = pytest.mark.skipif('sendfile' not in transfer.available_backends(), reason="needs the sendfile backend")
+
+CHUNK_SIZE = 64 * 1024
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'source.bin'
+    path.write_bytes(os.urandom(3 * CHUNK_SIZE + 123))
+    return str(path)
+
+
+def make_copier():
+    return FileCopier(backend='sendfile', chunk_size=CHUNK_SIZE, limiter=RateLimiter(), preallocate_size=0)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_backend_refusing_a_file_is_disabled(tmp_path, source, monkeypatch):
+    def refuse(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+        raise OSError(errno.EINVAL, "refused")
+
+    monkeypatch.setitem(transfer.BACKENDS, 'sendfile', refuse)
+    copier = make_copier()
+    copier.copy(source, str(tmp_path / 'target.bin'))
+
+    assert read(str(tmp_path / 'target.bin')) == read(source)
+    assert copier.disabled == {'sendfile'}
+    assert copier.usage['buffered'][0] == 1
+
+
+def test_backend_failing_partway_is_kept_and_its_progress_taken_back(tmp_path, source, monkeypatch):
+    def fail_partway(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+        fdst.write(fsrc.read(chunk_size))
+        on_chunk(chunk_size, chunk_size)
+        raise OSError(errno.EINVAL, "failed partway")
+
+    monkeypatch.setitem(transfer.BACKENDS, 'sendfile', fail_partway)
+    copier = make_copier()
+    reported = []
+    copier.copy(source, str(tmp_path / 'target.bin'), on_progress=reported.append)
+
+    assert read(str(tmp_path / 'target.bin')) == read(source)
+    assert 'sendfile' not in copier.disabled
+    assert -CHUNK_SIZE in reported
+    assert sum(reported) == os.path.getsize(source)
+
+
+def test_errors_outside_the_fallback_set_are_raised(tmp_path, source, monkeypatch):
+    def deny(fsrc, fdst, size, chunk_size, hasher=None, on_chunk=None):
+        raise OSError(errno.EPERM, "denied")
+
+    monkeypatch.setitem(transfer.BACKENDS, 'sendfile', deny)
+    copier = make_copier()
+
+    with pytest.raises(PermissionError):
+        copier.copy(source, str(tmp_path / 'target.bin'))
+    assert not copier.disabled
+
+
+def test_hashing_copier_records_the_source_digest(tmp_path, source):
+    copier = FileCopier(chunk_size=CHUNK_SIZE, hash_files=True, limiter=RateLimiter(), preallocate_size=0)
+    digest = copier.copy(source, str(tmp_path / 'target.bin'))
+
+    assert digest == hash_file(source, copier.hash_algorithm)
+    assert read(str(tmp_path / 'target.bin')) == read(source)
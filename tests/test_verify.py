@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+import pytest
+
+import verify
+from inventory import TreeInventory
+from verify import compare_files
+
+
+@pytest.fixture
+def trees(tmp_path):
+    source, target = tmp_path / 'source', tmp_path / 'target'
+    source.mkdir()
+    target.mkdir()
+    return str(source), str(target)
+
+
+def write(root, path, data, mtime_ns=None):
+    full_path = os.path.join(root, path)
+    with open(full_path, 'wb') as f:
+        f.write(data)
+    if mtime_ns is not None:
+        os.utime(full_path, ns=(mtime_ns, mtime_ns))
+    return full_path
+
+
+def compare(source, target, mode, **kwargs):
+    target_files = {entry.path: entry for entry in TreeInventory.scan(target).files}
+    pairs = [(entry, target_files[entry.path]) for entry in TreeInventory.scan(source).files]
+    return compare_files(source, target, pairs, mode, workers=1, **kwargs)
+
+
+def test_size_difference_is_found_in_every_mode(trees):
+    source, target = trees
+    write(source, 'a.bin', b'abc')
+    write(target, 'a.bin', b'ab')
+
+    for mode in verify.VERIFY_MODES:
+        assert compare(source, target, mode) == ['a.bin']
+
+
+def test_stat_trusts_matching_mtimes_and_compares_content_otherwise(trees):
+    source, target = trees
+    write(source, 'same.bin', b'abc', 10 ** 18)
+    write(target, 'same.bin', b'xyz', 10 ** 18)
+    write(source, 'newer.bin', b'abc', 10 ** 18)
+    write(target, 'newer.bin', b'xyz', 2 * 10 ** 18)
+
+    assert compare(source, target, 'stat') == ['newer.bin']
+
+
+def test_full_finds_content_differences_against_the_copy_digest(trees):
+    source, target = trees
+    write(source, 'a.bin', b'abc', 10 ** 18)
+    target_file = write(target, 'a.bin', b'xyz', 10 ** 18)
+    digest = f"sha1:{hashlib.sha1(b'abc').hexdigest()}"
+
+    assert compare(source, target, 'full', digests={target_file: digest}) == ['a.bin']
+    assert compare(source, target, 'full') == ['a.bin']
+
+
+def test_cloned_files_are_not_read(trees):
+    source, target = trees
+    write(source, 'a.bin', b'abc', 10 ** 18)
+    target_file = write(target, 'a.bin', b'xyz', 10 ** 18)
+
+    assert compare(source, target, 'full', cloned_files={target_file}) == []
+
+
+def test_sample_reads_the_ends_of_large_files(trees, monkeypatch):
+    monkeypatch.setattr(verify, 'VERIFY_SAMPLE_MIN_SIZE', 4 * verify.VERIFY_SAMPLE_CHUNK_SIZE)
+    data = os.urandom(8 * verify.VERIFY_SAMPLE_CHUNK_SIZE)
+    source, target = trees
+    write(source, 'large.bin', data, 10 ** 18)
+    write(target, 'large.bin', data[:-1] + bytes([data[-1] ^ 1]), 10 ** 18)
+
+    assert compare(source, target, 'sample') == ['large.bin']
+
+
+def test_manifest_checks_listed_files_against_their_sha1(trees):
+    source, target = trees
+    write(source, 'listed.bin', b'abc', 10 ** 18)
+    write(target, 'listed.bin', b'abc', 10 ** 18)
+    manifest_files = {os.path.normcase('listed.bin'): (3, hashlib.sha1(b'xyz').hexdigest())}
+
+    assert compare(source, target, 'manifest', manifest_files=manifest_files) == ['listed.bin']